@@ -8,9 +8,38 @@ import tkinter as tk
 import tkinter.ttk as ttk
 
 # Various message boxes for warnings, prompts, and errors
-from tkinter import simpledialog
+from tkinter import filedialog, simpledialog
 from tkinter.messagebox import askokcancel, askyesno, showerror, showinfo, WARNING, showwarning
 
+# json for passing lists of IDs as a single statement parameter
+import json
+
+# csv reading and content hashing for roster imports
+import csv
+import hashlib
+
+# Splitting wildcard patterns into their literal parts
+import re
+
+# Background loading of the vehicle table and startup timing
+import queue
+import threading
+import time
+
+# Decoding VINs across every core for roster imports
+import functools
+import operator
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+# Resolving database paths for read-only snapshot URIs
+import pathlib
+
+# Department database files named on the command line, searched on worker threads and merged in order
+import sys
+import heapq
+from concurrent.futures import ThreadPoolExecutor
+
 # sqlite3 and error handling
 import sqlite3 as sql
 from sqlite3 import Error
@@ -40,7 +69,9 @@ fields = (
         'label': 'VIN',
         'dash_width': 150,
         'search_by': 'string',
-        'entry_width': 50
+        'entry_width': 50,
+        'unique': True,
+        'trigram': True
         },
     {
         'column': 'dept',
@@ -90,7 +121,8 @@ fields = (
         'label': 'License Plate',
         'dash_width': 100,
         'search_by': 'string',
-        'entry_width': 50
+        'entry_width': 50,
+        'trigram': True
         },
     {
         'column': 'motor',
@@ -120,15 +152,197 @@ fields = (
         }
     )
 
+# Database files opened when no files are named on the command line
+# The first file is the one the program edits, the others are department files that are only read
+# Filter counts and exports search every file, see DataInterface.FilterRecords()
+DATABASE_FILES = ('fleet.db',)
+
+# Number of rows fetched from the database for the first page of the vehicle table
+PAGE_SIZE = 200
+
+# Number of rows per fetchmany() when the rest of the vehicle table streams in on a background thread
+CHUNK_SIZE = 1000
+
+# Milliseconds between checks for streamed rows to insert into the vehicle table
+RECEIVE_INTERVAL = 20
+
+# Largest number of changed records patched into the vehicle table row by row
+# Larger change sets, such as a big roster import, reload the table instead, which streams in on a background thread
+PATCH_LIMIT = 2000
+
+# Milliseconds between checks of the change journal for edits made by other windows or instances of the program
+POLL_INTERVAL = 2000
+
+# Number of change journal entries kept, older entries are pruned when the database is opened
+JOURNAL_SIZE = 10000
+
+# Maximum number of closed child windows of each class kept hidden for reuse
+POOL_SIZE = 10
+
+# Milliseconds between checks for a finished backup
+BACKUP_INTERVAL = 100
+
+# Columns marked 'trigram' are indexed by the fleet_trigram table so infix wildcard searches avoid scanning the table
+trigram_columns = tuple(field['column'] for field in fields if field.get('trigram', False))
+
+# Columns limited to the dropdown and radio value sets are counted in the fleet_summary table
+# Triggers keep the counts current, so the dashboard statistics never need to scan the fleet table
+summary_columns = tuple(field['column'] for field in fields if field['search_by'] in ('dropdown', 'radio'))
+
+# Number of roster rows sent to each worker process when checking VINs
+VIN_CHUNK_SIZE = 10000
+
+# Rosters with fewer rows than this are checked in this process, starting worker processes would take longer than the check
+VIN_POOL_THRESHOLD = 50000
+
+#################################################
+#| VIN Validation and Decoding                 |#
+#################################################
+
+# A 17 character VIN is checked and decoded with the tables below
+# Position 9 is a check digit, position 10 is the model year, and positions 1-3 are the World Manufacturer Identifier (WMI)
+# These are module level functions rather than methods so worker processes can run them for large roster imports
+
+# Values of the VIN characters for the check digit, the letters I, O, and Q are never used
+VIN_VALUES = {
+    'A': 1, 'B': 2, 'C': 3, 'D': 4, 'E': 5, 'F': 6, 'G': 7, 'H': 8,
+    'J': 1, 'K': 2, 'L': 3, 'M': 4, 'N': 5, 'P': 7, 'R': 9,
+    'S': 2, 'T': 3, 'U': 4, 'V': 5, 'W': 6, 'X': 7, 'Y': 8, 'Z': 9,
+    '0': 0, '1': 1, '2': 2, '3': 3, '4': 4, '5': 5, '6': 6, '7': 7, '8': 8, '9': 9
+    }
+
+VIN_CHARS = frozenset(VIN_VALUES)
+
+# Weight of each VIN position for the check digit, the check digit itself is weighted 0
+VIN_WEIGHTS = (8, 7, 6, 5, 4, 3, 2, 10, 0, 9, 8, 7, 6, 5, 4, 3, 2)
+
+# Model year codes in position 10, the codes repeat every 30 years starting in 1980
+VIN_YEAR_CODES = 'ABCDEFGHJKLMNPRSTVWXY123456789'
+
+# A decoded model year later than this belongs to the earlier 30 year cycle
+LATEST_VIN_YEAR = time.localtime().tm_year + 1
+
+# Makes of common World Manufacturer Identifiers
+# Three character WMIs are checked first, then two character prefixes shared by every WMI of a manufacturer
+WMI_MAKES = {
+    '1B3': 'Dodge', '1B7': 'Dodge', '1C3': 'Chrysler', '1C6': 'Ram', '1D7': 'Dodge',
+    '1FA': 'Ford', '1FB': 'Ford', '1FC': 'Ford', '1FD': 'Ford', '1FM': 'Ford', '1FT': 'Ford',
+    '1FU': 'Freightliner', '1FV': 'Freightliner',
+    '1G1': 'Chevrolet', '1G2': 'Pontiac', '1G3': 'Oldsmobile', '1G4': 'Buick', '1G6': 'Cadillac', '1G8': 'Saturn',
+    '1GC': 'Chevrolet', '1GN': 'Chevrolet', '1GK': 'GMC', '1GT': 'GMC', '1GY': 'Cadillac',
+    '1HD': 'Harley-Davidson', '1HG': 'Honda', '1HT': 'International', '1J4': 'Jeep', '1J8': 'Jeep',
+    '1LN': 'Lincoln', '1ME': 'Mercury', '1N4': 'Nissan', '1N6': 'Nissan', '1NX': 'Toyota',
+    '1VW': 'Volkswagen', '1YV': 'Mazda', '1ZV': 'Ford',
+    '2C3': 'Chrysler', '2FA': 'Ford', '2FM': 'Ford', '2FT': 'Ford', '2G1': 'Chevrolet',
+    '2HG': 'Honda', '2HK': 'Honda', '2HM': 'Hyundai', '2T1': 'Toyota', '2T3': 'Toyota',
+    '3FA': 'Ford', '3GC': 'Chevrolet', '3GN': 'Chevrolet', '3N1': 'Nissan', '3VW': 'Volkswagen',
+    '4JG': 'Mercedes-Benz', '4S3': 'Subaru', '4S4': 'Subaru', '4T1': 'Toyota', '4T3': 'Toyota', '4US': 'BMW',
+    '5FN': 'Honda', '5J6': 'Honda', '5N1': 'Nissan', '5NP': 'Hyundai', '5TD': 'Toyota', '5TF': 'Toyota',
+    '5UX': 'BMW', '5XY': 'Kia', '5YJ': 'Tesla',
+    'JA3': 'Mitsubishi', 'JF1': 'Subaru', 'JF2': 'Subaru', 'JH4': 'Acura', 'JHM': 'Honda', 'JM1': 'Mazda',
+    'JN1': 'Nissan', 'JN8': 'Nissan', 'JTH': 'Lexus', 'JTJ': 'Lexus', 'JT': 'Toyota',
+    'KM8': 'Hyundai', 'KMH': 'Hyundai', 'KNA': 'Kia', 'KND': 'Kia',
+    'SAJ': 'Jaguar', 'SAL': 'Land Rover', 'SCC': 'Lotus',
+    'VF1': 'Renault', 'VF3': 'Peugeot',
+    'WA1': 'Audi', 'WAU': 'Audi', 'WBA': 'BMW', 'WBS': 'BMW',
+    'WD3': 'Mercedes-Benz', 'WDB': 'Mercedes-Benz', 'WDC': 'Mercedes-Benz', 'WDD': 'Mercedes-Benz',
+    'WP0': 'Porsche', 'WP1': 'Porsche', 'WV1': 'Volkswagen', 'WV2': 'Volkswagen', 'WVW': 'Volkswagen',
+    'YV1': 'Volvo', 'YV2': 'Volvo', 'YV4': 'Volvo',
+    'ZAR': 'Alfa Romeo', 'ZFA': 'Fiat', 'ZFF': 'Ferrari'
+    }
+
+# Look up the make of a WMI, returns None for an unknown manufacturer
+# Every vehicle from a manufacturer shares a handful of WMIs, so the answers are cached
+@functools.lru_cache(maxsize=None)
+def LookupWMI(wmi):
+    return WMI_MAKES.get(wmi, WMI_MAKES.get(wmi[:2]))
+
+# Reduce a make to lowercase letters and digits so 'Mercedes Benz' matches 'Mercedes-Benz', cached like LookupWMI()
+@functools.lru_cache(maxsize=1024)
+def NormalizeMake(make):
+    return re.sub('[^a-z0-9]', '', make.lower())
+
+# Compute the check digit of a VIN from the values and weights of its characters
+def VINCheckDigit(vin):
+    remainder = sum(map(operator.mul, map(VIN_VALUES.__getitem__, vin), VIN_WEIGHTS)) % 11
+    return 'X' if remainder == 10 else str(remainder)
+
+# Decode a VIN into (problems, year, make)
+# problems is a list of reasons the VIN is invalid, year and make are None when they cannot be decoded
+def DecodeVIN(vin):
+    vin = vin.strip().upper()
+    if len(vin) != 17:
+        return ['the VIN must be 17 characters'], None, None
+    if not VIN_CHARS.issuperset(vin):
+        return ['the VIN cannot contain ' + ', '.join(sorted(set(vin) - VIN_CHARS))], None, None
+
+    problems = []
+    check_digit = VINCheckDigit(vin)
+    if vin[8] != check_digit:
+        problems.append('the check digit should be ' + check_digit)
+
+    #A letter in position 7 marks the 2010-2039 cycle of year codes, a code that would be more than a year in the future belongs to the earlier cycle
+    year = None
+    if vin[9] in VIN_YEAR_CODES:
+        year = 1980 + VIN_YEAR_CODES.index(vin[9])
+        if vin[6].isalpha():
+            year += 30
+        if year > LATEST_VIN_YEAR:
+            year -= 30
+
+    return problems, year, LookupWMI(vin[:3])
+
+# Decode a VIN and reconcile it with the year and make entered for the vehicle, returns (problems, year, make)
+# Blank year and make values are filled in from the VIN, entered values that disagree with the VIN are added to problems
+# Pass None for a year or make that is not being entered, it is returned as None
+def CheckVIN(vin, year, make):
+    problems, vin_year, vin_make = DecodeVIN(vin)
+    if year is not None and vin_year is not None:
+        if year.strip() == '':
+            year = str(vin_year)
+        elif year.strip() != str(vin_year):
+            problems.append('the VIN is for a {} model year, not {}'.format(vin_year, year.strip()))
+    if make is not None and vin_make is not None:
+        if make.strip() == '':
+            make = vin_make
+        elif NormalizeMake(make) != NormalizeMake(vin_make):
+            problems.append('the VIN is for a {}, not a {}'.format(vin_make, make.strip()))
+    return problems, year, make
+
+# Check a chunk of (vin, year, make) rows, the unit of work of each worker process
+def CheckVINChunk(rows):
+    return [CheckVIN(*row) for row in rows]
+
+# Check every (vin, year, make) row of a roster, returns the CheckVIN() results in row order
+# Large rosters are split into chunks and checked by a pool of worker processes, one per core
+def CheckVINs(rows):
+    if len(rows) < VIN_POOL_THRESHOLD:
+        return CheckVINChunk(rows)
+    chunks = [rows[i:i + VIN_CHUNK_SIZE] for i in range(0, len(rows), VIN_CHUNK_SIZE)]
+    results = []
+    try:
+        with ProcessPoolExecutor() as pool:
+            for chunk_results in pool.map(CheckVINChunk, chunks):
+                results.extend(chunk_results)
+    except (OSError, BrokenProcessPool):
+        #Worker processes could not be started, fall back to checking in this process
+        return CheckVINChunk(rows)
+    return results
+
 #################################################
 #| SQLite Database Interface Class             |#
 #################################################
 
+# A DataInterface opened with read_only=True is for reading a snapshot made by BackupDatabase()
+# It is not created or migrated, and every statement that writes fails
+# department_paths are other fleet databases searched along with this one by FilterRecords() and CountAllRecords()
+# They are opened read-only, so each department's file is only ever written by its own program
+
 class DataInterface:
 
     global fields
     
-    def __init__(self, db_path, parent):
+    def __init__(self, db_path, parent, read_only=False, department_paths=()):
         self.parent = parent
 
         #For each field, get the column name and sql type and append them to a list as a combined string
@@ -139,17 +353,252 @@ class DataInterface:
             keys.append(str(column_name) + ' ' + str(column_type))
 
         #Concatenate/join the strings to create a valid SQL command
-        cmd = 'CREATE TABLE IF NOT EXISTS fleet (v_num integer PRIMARY KEY, ' + ', '.join(keys[0:-1]) + ', ' + keys[-1] + ');'
+        #The version and row_hash columns follow the fields
+        #version is incremented by every update, see UpdateChangedColumns(), and row_hash is the content hash of the last import, see UpsertRecords()
+        cmd = 'CREATE TABLE IF NOT EXISTS fleet (v_num integer PRIMARY KEY, ' + ', '.join(keys[0:-1]) + ', ' + keys[-1] + ', version integer NOT NULL DEFAULT 0, row_hash text);'
 
         #Initialize the connection
+        #WAL journaling lets the background reader in StreamRecords() run while this connection writes
+        self.db_path = db_path
+        self.read_only = read_only
+        self.db_paths = (db_path,)
+        #Files in self.db_paths that have the fleet_trigram table, see BuildWhereClauses()
+        self.trigram_paths = set()
         self.conn = None
         try:
-            self.conn = sql.connect(db_path)
+            self.conn = self.Connect()
             self.curr = self.conn.cursor()
+            if read_only:
+                #Check that the snapshot is a database with a fleet table, the connection is closed if not
+                self.ExecuteStatement('SELECT v_num FROM fleet LIMIT 1;', '')
+                if self.HasTrigramIndex(db_path):
+                    self.trigram_paths.add(db_path)
+                self.parent.Log('Opened snapshot ' + db_path + ' read-only')
+                return
+            self.ExecuteStatement('PRAGMA journal_mode=WAL;', '')
             self.ExecuteStatement(cmd, '')
+            self.AddMissingColumns()
+            self.CreateIndexes()
+            self.CreateSummaryTable()
+            self.CreateChangeJournal()
+            self.CreateTrigramIndex()
+            self.trigram_paths.add(db_path)
             self.parent.Log('Connected to ' + db_path)
+            self.AddDepartments(department_paths)
         except Error as e:
-            self.parent.Log(e)
+            self.parent.Log('Error opening ' + db_path + ': ' + str(e))
+            if read_only:
+                self.Close()
+
+    # Open a new connection to the database, or to another file such as a department database
+    # Read-only connections use a URI with mode=ro
+    def Connect(self, db_path=None, read_only=False):
+        if db_path is None:
+            db_path = self.db_path
+            read_only = self.read_only
+        if read_only:
+            return sql.connect(pathlib.Path(db_path).resolve().as_uri() + '?mode=ro', uri=True)
+        return sql.connect(db_path)
+
+    # Add the department databases that can be opened to self.db_paths, files that cannot be read are logged and left out
+    # Department files are never migrated, so the ones made by older versions of the program may not have fleet_trigram
+    def AddDepartments(self, department_paths):
+        opened = set([pathlib.Path(self.db_path).resolve()])
+        for path in department_paths:
+            if pathlib.Path(path).resolve() in opened:
+                continue
+            try:
+                self.QueryDatabase(path, 'SELECT v_num FROM fleet LIMIT 1;', ())
+                if self.HasTrigramIndex(path):
+                    self.trigram_paths.add(path)
+                self.db_paths += (path,)
+                opened.add(pathlib.Path(path).resolve())
+                self.parent.Log('Added department database ' + path)
+            except Error as e:
+                self.parent.Log('Department database ' + path + ' was left out: ' + str(e))
+
+    # Check whether a database file has the fleet_trigram table
+    def HasTrigramIndex(self, db_path):
+        return len(self.QueryDatabase(db_path, "SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'fleet_trigram';", ())) > 0
+
+    # Run a SELECT on one database file with a connection of its own and return every row
+    # Department files are read-only, this database keeps its own mode
+    def QueryDatabase(self, db_path, statement, params):
+        if db_path == self.db_path:
+            conn = self.Connect()
+        else:
+            conn = self.Connect(db_path, read_only=True)
+        try:
+            return conn.execute(statement, params).fetchall()
+        finally:
+            conn.close()
+
+    # Run a filtered SELECT on every file in self.db_paths at once, one worker thread and connection per file
+    # sqlite3 releases the GIL while a statement runs, so a search of several large files uses several cores
+    #   select: the start of the statement up to FROM fleet, order: an optional ORDER BY clause
+    #   field_pairs and values follow the same format as FilterRecords(), the WHERE clauses are built for each file
+    # Returns the rows of each file in self.db_paths order, the first Error is raised
+    def QueryAllDatabases(self, select, field_pairs, values, order=''):
+        queries = []
+        for db_path in self.db_paths:
+            where, params = self.BuildWhereClauses(field_pairs, values, db_path)
+            cmd = select
+            if len(where) > 0:
+                cmd += ' WHERE ' + ' AND '.join(where)
+            queries.append((cmd + order + ';', params))
+
+        if len(self.db_paths) == 1:
+            return [self.QueryDatabase(self.db_path, *queries[0])]
+        with ThreadPoolExecutor(max_workers=len(self.db_paths)) as pool:
+            return list(pool.map(lambda db_path, query : self.QueryDatabase(db_path, *query), self.db_paths, queries))
+
+    # Close the connection, used for snapshots that are no longer needed
+    def Close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+    # Databases created by older versions of the program get the missing columns appended after the fields
+    def AddMissingColumns(self):
+        self.ExecuteStatement('PRAGMA table_info(fleet);', '')
+        columns = [column[1] for column in self.curr.fetchall()]
+        if 'version' not in columns:
+            self.ExecuteStatement('ALTER TABLE fleet ADD COLUMN version integer NOT NULL DEFAULT 0;', '')
+        if 'row_hash' not in columns:
+            self.ExecuteStatement('ALTER TABLE fleet ADD COLUMN row_hash text;', '')
+
+    # Index every column after the primary key so sorting the vehicle table by any column can walk an index
+    # v_num is the rowid, so each index is implicitly ordered by (column, v_num), which is the keyset used by SelectPage()
+    # Fields marked 'unique' get a unique index instead, which fails if the table already holds duplicates
+    def CreateIndexes(self):
+        for i in range(1, len(fields)):
+            column_name = fields[i]['column']
+            if fields[i].get('unique', False):
+                try:
+                    self.ExecuteStatement('CREATE UNIQUE INDEX IF NOT EXISTS fleet_' + column_name + '_unique ON fleet (' + column_name + ');', '')
+                    self.ExecuteStatement('DROP INDEX IF EXISTS fleet_' + column_name + '_idx;', '')
+                    continue
+                except sql.IntegrityError:
+                    self.conn.rollback()
+                    self.parent.Log('Duplicate ' + fields[i]['label'] + ' values found, they must be fixed before duplicates can be prevented.')
+            self.ExecuteStatement('CREATE INDEX IF NOT EXISTS fleet_' + column_name + '_idx ON fleet (' + column_name + ');', '')
+
+    # Create the fleet_summary table of record counts grouped by summary_columns and the triggers that maintain it
+    # NULL is stored as '' so each combination of values has exactly one row
+    def CreateSummaryTable(self):
+        self.ExecuteStatement("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'fleet_summary';", '')
+        isNewTable = self.curr.fetchone() is None
+
+        columns = ', '.join(summary_columns)
+        cmd = 'CREATE TABLE IF NOT EXISTS fleet_summary (' + ' text, '.join(summary_columns) + ' text, total integer, PRIMARY KEY (' + columns + '));'
+        self.ExecuteStatement(cmd, '')
+
+        #Each trigger statement matches the summary row by the old or new values of the record
+        new_values = ', '.join("ifnull(NEW." + column + ", '')" for column in summary_columns)
+        old_match = ' AND '.join(column + " = ifnull(OLD." + column + ", '')" for column in summary_columns)
+        add_new = 'INSERT INTO fleet_summary (' + columns + ', total) VALUES (' + new_values + ', 1) ON CONFLICT (' + columns + ') DO UPDATE SET total = total + 1; '
+        remove_old = 'UPDATE fleet_summary SET total = total - 1 WHERE ' + old_match + '; DELETE FROM fleet_summary WHERE total = 0 AND ' + old_match + '; '
+
+        self.ExecuteStatement('CREATE TRIGGER IF NOT EXISTS fleet_summary_insert AFTER INSERT ON fleet BEGIN ' + add_new + 'END;', '')
+        self.ExecuteStatement('CREATE TRIGGER IF NOT EXISTS fleet_summary_delete AFTER DELETE ON fleet BEGIN ' + remove_old + 'END;', '')
+        self.ExecuteStatement('CREATE TRIGGER IF NOT EXISTS fleet_summary_update AFTER UPDATE OF ' + columns + ' ON fleet BEGIN ' + remove_old + add_new + 'END;', '')
+
+        #Records added before the summary table existed are counted once with a single aggregate
+        if isNewTable:
+            select_values = ', '.join("ifnull(" + column + ", '')" for column in summary_columns)
+            self.ExecuteStatement('INSERT INTO fleet_summary (' + columns + ', total) SELECT ' + select_values + ', COUNT(*) FROM fleet GROUP BY ' + select_values + ';', '')
+
+    # Create the fleet_changes journal, triggers record the v_num of every inserted, updated or deleted record
+    # seq uses AUTOINCREMENT so sequence numbers only ever increase, even after old entries are pruned
+    def CreateChangeJournal(self):
+        self.ExecuteStatement('CREATE TABLE IF NOT EXISTS fleet_changes (seq integer PRIMARY KEY AUTOINCREMENT, v_num integer, operation text);', '')
+        for operation, row in (('insert', 'NEW'), ('update', 'NEW'), ('delete', 'OLD')):
+            cmd = 'CREATE TRIGGER IF NOT EXISTS fleet_changes_' + operation + ' AFTER ' + operation.upper() + ' ON fleet BEGIN '
+            cmd += "INSERT INTO fleet_changes (v_num, operation) VALUES (" + row + ".v_num, '" + operation + "'); END;"
+            self.ExecuteStatement(cmd, '')
+        self.ExecuteStatement('DELETE FROM fleet_changes WHERE seq <= (SELECT MAX(seq) FROM fleet_changes) - ?;', (JOURNAL_SIZE,))
+
+    # Create the fleet_trigram FTS5 index over trigram_columns, using the trigram tokenizer so LIKE '%...%' can use it
+    # It is an external content table that stores only the index, triggers keep it in step with fleet
+    def CreateTrigramIndex(self):
+        self.ExecuteStatement("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'fleet_trigram';", '')
+        isNewTable = self.curr.fetchone() is None
+
+        columns = ', '.join(trigram_columns)
+        new_values = ', '.join('NEW.' + column for column in trigram_columns)
+        old_values = ', '.join('OLD.' + column for column in trigram_columns)
+        add_new = 'INSERT INTO fleet_trigram (rowid, ' + columns + ') VALUES (NEW.v_num, ' + new_values + '); '
+        remove_old = "INSERT INTO fleet_trigram (fleet_trigram, rowid, " + columns + ") VALUES ('delete', OLD.v_num, " + old_values + "); "
+
+        self.ExecuteStatement("CREATE VIRTUAL TABLE IF NOT EXISTS fleet_trigram USING fts5(" + columns + ", content='fleet', content_rowid='v_num', tokenize='trigram');", '')
+        self.ExecuteStatement('CREATE TRIGGER IF NOT EXISTS fleet_trigram_insert AFTER INSERT ON fleet BEGIN ' + add_new + 'END;', '')
+        self.ExecuteStatement('CREATE TRIGGER IF NOT EXISTS fleet_trigram_delete AFTER DELETE ON fleet BEGIN ' + remove_old + 'END;', '')
+        self.ExecuteStatement('CREATE TRIGGER IF NOT EXISTS fleet_trigram_update AFTER UPDATE OF ' + columns + ' ON fleet BEGIN ' + remove_old + add_new + 'END;', '')
+
+        #Records added before the index existed are indexed once
+        if isNewTable:
+            self.ExecuteStatement("INSERT INTO fleet_trigram (fleet_trigram) VALUES ('rebuild');", '')
+
+    # Get the sequence number of the latest change, 0 if nothing has been journaled
+    def GetLastChangeSeq(self):
+        self.ExecuteStatement('SELECT ifnull(MAX(seq), 0) FROM fleet_changes;', '')
+        return self.curr.fetchone()[0]
+
+    # Select the (seq, v_num, operation) journal entries after seq in order
+    # Returns None if entries after seq were already pruned, the caller then has to reload everything
+    def SelectChangesSince(self, seq):
+        try:
+            self.ExecuteStatement('SELECT MIN(seq) FROM fleet_changes;', '')
+            first_seq = self.curr.fetchone()[0]
+            if first_seq is not None and first_seq > seq + 1:
+                return None
+            self.ExecuteStatement('SELECT seq, v_num, operation FROM fleet_changes WHERE seq > ? ORDER BY seq;', (seq,))
+            return self.curr.fetchall()
+        except Error as e:
+            self.parent.Log('Error reading change journal: ' + str(e))
+            self.conn.rollback()
+            return e
+
+    # Select the records with the given IDs, optionally limited to the records that also match a filter
+    #   field_pairs and values follow the same format as FilterRecords()
+    def SelectRecords(self, ids, field_pairs=(), values=()):
+        where, params = self.BuildWhereClauses(field_pairs, values)
+        result = []
+        try:
+            #Query in chunks to stay under SQLite's limit on the number of parameters
+            for i in range(0, len(ids), 500):
+                chunk = list(ids[i:i+500])
+                cmd = 'SELECT * FROM fleet WHERE v_num IN (' + ', '.join('?' * len(chunk)) + ')'
+                if len(where) > 0:
+                    cmd += ' AND ' + ' AND '.join(where)
+                self.ExecuteStatement(cmd + ';', chunk + params)
+                result += self.curr.fetchall()
+            return result
+        except Error as e:
+            self.parent.Log('Error selecting records: ' + str(e))
+            self.conn.rollback()
+            return e
+
+    # Sum the summary counts matching the criteria, a list of (column, value) pairs from summary_columns
+    # An empty criteria list counts every record
+    def CountSummary(self, criteria):
+        where = []
+        values = []
+        for column, value in criteria:
+            where.append(column + ' = ?')
+            values.append(value)
+
+        cmd = 'SELECT ifnull(SUM(total), 0) FROM fleet_summary'
+        if len(where) > 0:
+            cmd += ' WHERE ' + ' AND '.join(where)
+
+        try:
+            self.ExecuteStatement(cmd + ';', values)
+            return self.curr.fetchone()[0]
+        except Error as e:
+            self.parent.Log('Statistics error: ' + str(e))
+            self.conn.rollback()
+            return e
 
     # SQL statement execution method
     #   statement: the SQL command string
@@ -193,68 +642,307 @@ class DataInterface:
                 self.conn.rollback()
                 return e
 
-    # Update an existing record
-    def UpdateRecord(self, values):
+    # Update only the changed columns of a record if it still has the version it was read with
+    #   changes: list of (column, value) pairs
+    # Returns the number of updated rows, 1 on success or 0 if the record was changed or deleted since it was read
+    def UpdateChangedColumns(self, id, version, changes):
         columns = []
-        for i in range(0, len(fields)):
-            columns.append(fields[i]['column'])
+        values = []
+        for column, value in changes:
+            columns.append(column + ' = ?')
+            values.append(value)
+
+        cmd = 'UPDATE fleet SET ' + ', '.join(columns) + ', version = version + 1, row_hash = NULL WHERE v_num = ? AND version = ?;'
 
-        cmd = 'UPDATE fleet SET ' + ' = ?, '.join(columns[1:]) + ' = ? WHERE ' + columns[0] + ' = ?;'
-        
         try:
-            self.ExecuteStatement(cmd, values)
-            self.parent.Log("Vehicle #" + str(values[-1]) + " updated.")
+            self.ExecuteStatement(cmd, values + [id, version])
+            if self.curr.rowcount == 1:
+                self.parent.Log("Vehicle #" + str(id) + " updated.")
+            else:
+                self.parent.Log("Vehicle #" + str(id) + " was not updated, it was changed or deleted after it was opened.")
+            return self.curr.rowcount
         except Error as e:
-            self.parent.Log("Error updating Vehicle #" + str(values[-1]) + " record: " + str(e))
+            self.parent.Log("Error updating Vehicle #" + str(id) + " record: " + str(e))
             self.conn.rollback()
             return e
 
-    # Select all records, return fetchall() list of records/values
-    def SelectAllRecords(self):
-        cmd = 'SELECT * FROM fleet'
-        self.ExecuteStatement(cmd,'')
-        return self.curr.fetchall()
+    # Set the same column values on every record in ids with one statement in one transaction
+    #   changes: list of (column, value) pairs
+    # The IDs are passed as one JSON array parameter, so the statement does not grow with the number of records
+    def UpdateRecords(self, ids, changes):
+        columns = []
+        values = []
+        for column, value in changes:
+            columns.append(column + ' = ?')
+            values.append(value)
+
+        cmd = 'UPDATE fleet SET ' + ', '.join(columns) + ', version = version + 1, row_hash = NULL WHERE v_num IN (SELECT value FROM json_each(?));'
+
+        try:
+            self.ExecuteStatement(cmd, values + [json.dumps([int(id) for id in ids])])
+            self.parent.Log('{} vehicles updated.'.format(self.curr.rowcount))
+            return self.curr.rowcount
+        except Error as e:
+            self.parent.Log('Error updating vehicles: ' + str(e))
+            self.conn.rollback()
+            return e
+
+    # Insert or update records by VIN in one transaction, touching only records whose content changed since the last import
+    #   columns: the field columns present in the rows, must include vin
+    #   rows: lists of values in the order of columns
+    # Every row is hashed, edits made in the program clear row_hash, so a record is only rewritten if the hash differs
+    # Returns a tuple of the (inserted, updated, unchanged) counts
+    def UpsertRecords(self, columns, rows):
+        #Field columns missing from the roster are inserted as empty strings like AddRecord(), updates leave them unchanged
+        missing = [field['column'] for field in fields[1:] if field['column'] not in columns]
+
+        #A row is inserted with version 0 and an update increments it, so RETURNING version tells them apart
+        #Rows skipped by the DO UPDATE ... WHERE return nothing
+        updates = [column + ' = excluded.' + column for column in columns if column != 'v_num' and column != 'vin']
+        cmd = 'INSERT INTO fleet (' + ', '.join(columns + missing) + ', row_hash) VALUES (' + (len(columns) + len(missing))*'?, ' + '?)'
+        cmd += ' ON CONFLICT (vin) DO UPDATE SET ' + ', '.join(updates + ['version = version + 1', 'row_hash = excluded.row_hash'])
+        cmd += ' WHERE fleet.row_hash IS NOT excluded.row_hash RETURNING version;'
+
+        #v_num is left out of the hash, existing records keep their number
+        hashed = [i for i in range(len(columns)) if columns[i] != 'v_num']
+
+        inserted = 0
+        updated = 0
+        unchanged = 0
+        try:
+            for row in rows:
+                row_hash = hashlib.sha1('\x1f'.join(str(row[i]) for i in hashed).encode()).hexdigest()
+                self.curr.execute(cmd, list(row) + ['']*len(missing) + [row_hash])
+                result = self.curr.fetchone()
+                if result is None:
+                    unchanged += 1
+                elif result[0] == 0:
+                    inserted += 1
+                else:
+                    updated += 1
+            self.conn.commit()
+            self.parent.Log('Import finished: {} added, {} updated, {} unchanged.'.format(inserted, updated, unchanged))
+            return inserted, updated, unchanged
+        except Error as e:
+            self.parent.Log('Error importing records, no records were changed: ' + str(e))
+            self.conn.rollback()
+            return e
+
+    # Select the record with the given VIN, None if there is no such record
+    def SelectRecordByVIN(self, vin):
+        cmd = 'SELECT * FROM fleet WHERE vin = ?;'
+        self.ExecuteStatement(cmd, (vin,))
+        return self.curr.fetchone()
     
-    # Filter Records based on user query
-    #   Parameter fields is a list containing tuple pairs, each pair contains the column name and a boolean for a wildcard search
+    # Assemble the WHERE clauses of a SQL command based on column name and whether a wildcard (%) was used
+    #   Parameter field_pairs is a list containing tuple pairs, each pair contains the column name and a boolean for a wildcard search
     #   Parameter values is the list of corresponding query values
-
-    def FilterRecords(self, fields, values):
-        #Assemble the WHERE clauses of the SQL command based on column name and whether a wildcard (%) was used
-        #The bool isWildSearch is determined by logic in the InspectRecordWindow class
+    #   Parameter db_path is the file the clauses are for, this database if None
+    #   Returns a list of clauses to be joined with AND and the list of their parameters
+    def BuildWhereClauses(self, field_pairs, values, db_path=None):
+        #Files without the fleet_trigram table, such as department files made by older versions of the program, use the LIKE alone
+        use_trigram = (self.db_path if db_path is None else db_path) in self.trigram_paths
         where = []
-        for column, isWildSearch in fields:
+        params = []
+        for (column, isWildSearch), value in zip(field_pairs, values):
             if(isWildSearch):
+                #The trigram index needs 3 characters in a row to look up, it returns candidates which the LIKE then rechecks
+                if use_trigram and column in trigram_columns and max(len(part) for part in re.split('[%_]', value)) >= 3:
+                    where.append('v_num IN (SELECT rowid FROM fleet_trigram WHERE ' + column + ' LIKE ?)')
+                    params.append(value)
                 where.append(column + " LIKE ?")
             else:
                 where.append(column + ' = ?')
+            params.append(value)
+        return where, params
 
-        #Example command string: 'SELECT * FROM fleet WHERE v_num = 555555 AND make LIKE ?;'
-        cmd = 'SELECT * FROM fleet WHERE ' + ' AND '.join(where) + ';'
+    # Count the records matching a filter, an empty filter counts the whole table
+    #   field_pairs and values follow the same format as FilterRecords()
+    def CountRecords(self, field_pairs, values):
+        where, params = self.BuildWhereClauses(field_pairs, values)
+        cmd = 'SELECT COUNT(*) FROM fleet'
+        if len(where) > 0:
+            cmd += ' WHERE ' + ' AND '.join(where)
 
-        #Execute statement, check the number of records and print to console, return the result, rollback any errors
         try:
-            self.ExecuteStatement(cmd, values)
-            result = self.curr.fetchall()
-            num_records = len(result)
-            if num_records == 0:
-                self.parent.Log('The query returned 0 records.')
-                return None
-            elif num_records != 1:
-                self.parent.Log('The query returned {} records.'.format(num_records))
-                return result
-            else:
-                self.parent.Log('The query returned 1 record.')
-                return result
+            self.ExecuteStatement(cmd + ';', params)
+            return self.curr.fetchone()[0]
+        except Error as e:
+            self.parent.Log('Count error: ' + str(e))
+            self.conn.rollback()
+            return e
+
+    # Filter Records based on user query, searching every database in self.db_paths
+    # The results are merged in the order SelectPage() would return them
+    #   Parameter field_pairs is a list containing tuple pairs, each pair contains the column name and a boolean for a wildcard search
+    #   Parameter values is the list of corresponding query values, an empty filter selects every record
+    #   Returns a list of (database path, record) pairs, or the Error if any file could not be searched
+    def FilterRecords(self, field_pairs, values, sort_index=0, descending=False):
+        direction = ' DESC' if descending else ''
+        order = ' ORDER BY ' + fields[sort_index]['column'] + direction + ', v_num' + direction
+
+        try:
+            results = self.QueryAllDatabases('SELECT * FROM fleet', field_pairs, values, order)
         except Error as e:
             self.parent.Log('Search error: ' + str(e))
+            return e
+
+        #Each file's records are already sorted, so they only need to be merged
+        sources = []
+        for db_path, records in zip(self.db_paths, results):
+            sources.append([(db_path, record) for record in records])
+        return list(heapq.merge(*sources, key=lambda pair : self.SortKey(pair[1], sort_index), reverse=descending))
+
+    # Sort key of a record that orders like SQLite's ORDER BY column, v_num, used to merge results and to place patched table rows
+    # SQLite sorts NULLs first, then numbers, then text, so values of different types are ranked before they are compared
+    def SortKey(self, record, sort_index):
+        value = record[sort_index]
+        if value is None:
+            return (0, 0, record[0])
+        elif isinstance(value, (int, float)):
+            return (1, value, record[0])
+        elif isinstance(value, str):
+            return (2, value, record[0])
+        return (3, value, record[0])
+
+    # Count the records matching a filter in every database in self.db_paths
+    #   field_pairs and values follow the same format as FilterRecords()
+    #   Returns the total count, or the Error if any file could not be counted
+    def CountAllRecords(self, field_pairs, values):
+        try:
+            return sum(rows[0][0] for rows in self.QueryAllDatabases('SELECT COUNT(*) FROM fleet', field_pairs, values))
+        except Error as e:
+            self.parent.Log('Count error: ' + str(e))
+            return e
+
+    # Select one page of records ordered by a column, using keyset pagination so deep pages cost the same as the first
+    #   field_pairs and values: the active filter in the same format as FilterRecords(), may be empty
+    #   sort_index: index into fields of the column to sort by
+    #   descending: bool for the sort direction
+    #   after: the last record of the previous page, or None for the first page
+    def SelectPage(self, field_pairs, values, sort_index=0, descending=False, after=None, limit=PAGE_SIZE):
+        result = []
+        try:
+            for segment in self.GetPageSegments(sort_index, descending, after):
+                cmd, params = self.BuildSegmentQuery(field_pairs, values, sort_index, descending, after, segment)
+                params.append(limit - len(result))
+
+                self.ExecuteStatement(cmd + ' LIMIT ?;', params)
+                result += self.curr.fetchall()
+                if len(result) == limit:
+                    break
+                #Any following segment is read from its beginning
+                after = None
+            return result
+        except Error as e:
+            self.parent.Log('Error loading records: ' + str(e))
             self.conn.rollback()
             return e
+
+    # Stream every record after the given one in the same order as SelectPage(), run on a background thread by MainAppWindow
+    # sqlite3 connections belong to the thread that opened them, so the records are read through a connection of its own
+    # Chunks of records from fetchmany() are put on row_queue as (generation, records), then (generation, None) when done
+    # Errors are put on the queue instead of logged, since only the main thread may update the widgets
+    def StreamRecords(self, field_pairs, values, sort_index, descending, after, row_queue, generation, stop_event):
+        conn = None
+        try:
+            conn = self.Connect()
+            curr = conn.cursor()
+            for segment in self.GetPageSegments(sort_index, descending, after):
+                cmd, params = self.BuildSegmentQuery(field_pairs, values, sort_index, descending, after, segment)
+                curr.execute(cmd + ';', params)
+                rows = curr.fetchmany(CHUNK_SIZE)
+                while len(rows) > 0:
+                    if stop_event.is_set():
+                        return
+                    row_queue.put((generation, rows))
+                    rows = curr.fetchmany(CHUNK_SIZE)
+                after = None
+            row_queue.put((generation, None))
+        except Error as e:
+            row_queue.put((generation, e))
+        finally:
+            if conn is not None:
+                conn.close()
+
+    # Copy the database to a snapshot file with VACUUM INTO, run on a background thread by MainAppWindow
+    # The copy is read from one WAL snapshot, so it is consistent and the live database can still be written while it runs
+    # VACUUM INTO will not replace an existing file, so the copy is made in a temporary file that then replaces target_path
+    # None is put on result_queue when the backup is done, or the Error if it failed
+    def BackupDatabase(self, target_path, result_queue):
+        temp_path = pathlib.Path(target_path + '.tmp')
+        conn = None
+        try:
+            temp_path.unlink(missing_ok=True)
+            conn = self.Connect()
+            conn.execute('VACUUM INTO ?;', (str(temp_path),))
+            conn.close()
+            conn = None
+            temp_path.replace(target_path)
+            result_queue.put(None)
+        except (Error, OSError) as e:
+            result_queue.put(e)
+        finally:
+            if conn is not None:
+                conn.close()
+
+    # Build the SELECT command without a LIMIT and its parameters for one segment of SelectPage()
+    def BuildSegmentQuery(self, field_pairs, values, sort_index, descending, after, segment):
+        where, params, order = self.BuildSegmentClauses(field_pairs, values, sort_index, descending, after, segment)
+        cmd = 'SELECT * FROM fleet'
+        if len(where) > 0:
+            cmd += ' WHERE ' + ' AND '.join(where)
+        cmd += ' ORDER BY ' + order
+        return cmd, params
+
+    # Get the segments SelectPage() reads in order, starting from the segment containing the after record
+    # SQLite sorts NULL before every other value, so rows with a NULL sort value are read as their own 'null' segment
+    # This keeps each query a single range search on the column index instead of an OR that scans it
+    def GetPageSegments(self, sort_index, descending, after):
+        if sort_index == 0:
+            return ['value']
+        elif descending:
+            segments = ['value', 'null']
+        else:
+            segments = ['null', 'value']
+
+        if after is not None:
+            current = 'null' if after[sort_index] is None else 'value'
+            segments = segments[segments.index(current):]
+        return segments
+
+    # Build the WHERE clauses, parameters and ORDER BY for one segment of SelectPage(), segment is 'null' or 'value'
+    def BuildSegmentClauses(self, field_pairs, values, sort_index, descending, after, segment):
+        where, params = self.BuildWhereClauses(field_pairs, values)
+        column = fields[sort_index]['column']
+        direction = ' DESC' if descending else ' ASC'
+        compare = ' < ' if descending else ' > '
+
+        #Ties on the sort column are broken by v_num, so (column, v_num) of the last row marks where the next page starts
+        if sort_index == 0:
+            order = 'v_num' + direction
+            if after is not None:
+                where.append('v_num' + compare + '?')
+                params.append(after[0])
+        elif segment == 'null':
+            order = 'v_num' + direction
+            where.append(column + ' IS NULL')
+            if after is not None:
+                where.append('v_num' + compare + '?')
+                params.append(after[0])
+        else:
+            order = column + direction + ', v_num' + direction
+            if after is not None:
+                where.append('(' + column + ', v_num)' + compare + '(?, ?)')
+                params.extend((after[sort_index], after[0]))
+            else:
+                where.append(column + ' IS NOT NULL')
+
+        return where, params, order
     
-    # Select a column value from a unique ID
-    def GetRecordValue(self, field, id):
-        cmd = 'SELECT ' + field + ' FROM fleet WHERE v_num = ?;'
-        self.ExecuteStatement(cmd,(id,))
+    # Get the highest v_num in use, 0 if the table is empty
+    def GetLastID(self):
+        self.ExecuteStatement('SELECT ifnull(MAX(v_num), 0) FROM fleet;', '')
         return self.curr.fetchone()[0]
 
 #################################################
@@ -263,12 +951,15 @@ class DataInterface:
 
 # MainAppWindow inherits from the root window class tk.Tk
 # MainAppWindow is called when this file is run as the main program
-# Children window classes FilterWindow, InspectRecordWindow, and AddRecordWindow are instantiated when the user clicks the corresponding buttons
+# Children window classes FilterWindow, InspectRecordWindow, NewRecordWindow, and BatchEditWindow are opened from their pools when the user clicks the corresponding buttons
 
 class MainAppWindow(tk.Tk):
     def __init__(self):
         super().__init__()
 
+        #Start of the time-to-interactive measurement reported by ReportStartup()
+        self.startTime = time.perf_counter()
+
         self.resizable(False, False)
         self.title('Fleet Manager')
         self.iconphoto(True, tk.PhotoImage(file='HWcar-5-icon.png'))
@@ -289,16 +980,49 @@ class MainAppWindow(tk.Tk):
         self.geometry('+{}+{}'.format(xOffset, yOffset))
 
     # Create the reference to the database interface
+    # Database files named on the command line replace DATABASE_FILES, the first one is edited and the rest are department files
     def LinkDatabase(self):
-        dbFilename = 'fleet.db'
-        self.database = DataInterface(dbFilename, self)
+        dbFilenames = sys.argv[1:] or DATABASE_FILES
+        self.database = DataInterface(dbFilenames[0], self, department_paths=dbFilenames[1:])
+        self.statsDatabase = self.database
     
     # Create the frames, treeview table, buttons, labels, etc.
     def CreateDashboard(self):
         global fields
         
-        #Bool for tracking if any treeview items are selected
+        #Bool for tracking if any treeview items are selected, and the v_num of each selected item
         self.isListSelected = False
+        self.selected_ids = []
+
+        #The active filter (in FilterRecords() format) and sort order used whenever the table is populated
+        self.activeFilter = ([], [])
+        self.sortIndex = 0
+        self.sortDescending = False
+
+        #Last change journal entry applied to the table and the inspector windows that get patched with changes
+        self.changeSeq = 0
+        self.openInspectors = []
+
+        #Sort keys of the rows in the table, in table order, and the key of each row by v_num
+        #They are kept by InsertRows() and PatchTableRow(), so patching finds a row's position without a query
+        #and len(self.rowKeys) is the number of loaded rows without counting the treeview
+        self.rowKeys = []
+        self.rowKeyById = {}
+
+        #Table loading state, the last loaded record marks where the streamed records continue
+        #loadGeneration tags the streamed chunks so chunks of a replaced load are discarded
+        self.lastRow = None
+        self.hasMoreRows = False
+        self.rowQueue = queue.Queue()
+        self.loadGeneration = 0
+        self.stopEvent = threading.Event()
+        self.loadSeq = 0
+        self.loadStart = 0
+        self.displayPopulation = 0
+
+        #The queue of a running backup, see BackUpDatabase()
+        self.backupQueue = None
+        self.backupStart = 0
 
         self.dashFrame = ttk.LabelFrame(self, text='Dashboard')
         self.dashFrame.pack(padx=5, pady=5, fill='x')
@@ -312,6 +1036,9 @@ class MainAppWindow(tk.Tk):
         self.modifyFilterButton.pack(padx=5, pady=5, side='left')
         self.clearFilterButton = ttk.Button(self.filterFrame, text='Clear Filter', state=tk.DISABLED, command=lambda : self.FilterWindowHandler(filterStatus = 'clearing'))
         self.clearFilterButton.pack(padx=5, pady=5, side='left')
+        ttk.Button(self.filterFrame, text='Export Vehicles', command=self.ExportRecords).pack(padx=5, pady=5, side='left')
+        self.backupButton = ttk.Button(self.filterFrame, text='Back Up Database', command=self.BackUpDatabase)
+        self.backupButton.pack(padx=5, pady=5, side='right')
         
         #Vehicle List treeview table
         self.tableFrame = ttk.Frame(self.dashFrame)
@@ -326,11 +1053,13 @@ class MainAppWindow(tk.Tk):
         self.vehicleTable.bind('<Double-1>', self.DoubleClickInspect)
 
         #Set the treeview headings and column widths by looping through their values in the fields dictionary
+        #Clicking a heading sorts the table by that column
         for i in range((len(fields))):
             heading_text = fields[i]['label']
             dash_width = fields[i]['dash_width']
             self.vehicleTable.column(i, anchor=tk.W, width=dash_width, minwidth=dash_width, stretch=0)
-            self.vehicleTable.heading(i, text=heading_text, anchor=tk.W)
+            self.vehicleTable.heading(i, text=heading_text, anchor=tk.W, command=lambda sort_index=i : self.SortByColumn(sort_index))
+        self.UpdateSortIndicator()
 
         #X and Y Scrollbars to scroll through the content
         self.tableYScroll = ttk.Scrollbar(self.tableFrame, orient=tk.VERTICAL, command=self.vehicleTable.yview)
@@ -347,13 +1076,41 @@ class MainAppWindow(tk.Tk):
         self.inspectVehicleButton.pack(padx=5, pady=5, side='left')
         self.deleteVehicleButton = ttk.Button(self.listButtonFrame, text='Delete Selected Vehicles', state=tk.DISABLED, command=self.DeleteSelectedRecords)
         self.deleteVehicleButton.pack(padx=5, pady=5, side='left')
-        ttk.Button(self.listButtonFrame, text='Add New Vehicle', command=lambda : NewRecordWindow(self)).pack(padx=5, pady=5, side='right')
+        self.batchEditButton = ttk.Button(self.listButtonFrame, text='Edit Selected Vehicles', state=tk.DISABLED, command=lambda : BatchEditWindow.Open(self, self.selected_ids))
+        self.batchEditButton.pack(padx=5, pady=5, side='left')
+        ttk.Button(self.listButtonFrame, text='Add New Vehicle', command=lambda : NewRecordWindow.Open(self)).pack(padx=5, pady=5, side='right')
         ttk.Button(self.listButtonFrame, text='Inspect by Vehicle #', command=self.InspectByIdDialog).pack(padx=5, pady=5, side='right')
+        ttk.Button(self.listButtonFrame, text='Import Roster', command=self.ImportRoster).pack(padx=5, pady=5, side='right')
+
+        #Statistics panel counts the vehicles matching a combination of the dropdown and radio values
+        #A blank selection matches any value
+        self.statsFrame = ttk.LabelFrame(self.dashFrame, text='Fleet Statistics')
+        self.statsFrame.grid(row=3, padx=5, pady=5, sticky='ew')
+        self.stats_vars = []
+        for column in summary_columns:
+            field = next(field for field in fields if field['column'] == column)
+            if field['search_by'] == 'dropdown':
+                stats_values = field['dropdown_values']
+            else:
+                stats_values = ('',) + field['radio_values']
+            self.stats_vars.append(tk.StringVar(self, ''))
+            ttk.Label(self.statsFrame, text=field['label']).pack(padx=5, pady=5, side='left')
+            statsDropdown = ttk.Combobox(self.statsFrame, width=15, textvariable=self.stats_vars[-1], values=stats_values, state='readonly')
+            statsDropdown.pack(padx=5, pady=5, side='left')
+            statsDropdown.bind('<<ComboboxSelected>>', lambda event : self.UpdateStatistics())
+        self.statsCount = tk.StringVar(self)
+        ttk.Label(self.statsFrame, textvariable=self.statsCount).pack(padx=5, pady=5, side='right')
+
+        #The statistics can be read from a snapshot instead of the live database, see ToggleSnapshot()
+        #statsDatabase is set to the live database by LinkDatabase()
+        self.statsDatabase = None
+        self.snapshotButton = ttk.Button(self.statsFrame, text='Open Snapshot', command=self.ToggleSnapshot)
+        self.snapshotButton.pack(padx=5, pady=5, side='right')
 
         #Text widget for displaying a log of activities
         self.logLine = 0
         self.logFrame = ttk.LabelFrame(self.dashFrame, text='Operation Log')
-        self.logFrame.grid(row=3, padx=5, pady=5)
+        self.logFrame.grid(row=4, padx=5, pady=5)
         self.logTextBox = tk.Text(self.logFrame, height=5, width=137, state=tk.DISABLED)
         self.logTextBox.pack(padx=5, pady=5, side='left')
         self.logYScroll = ttk.Scrollbar(self.logFrame, orient=tk.VERTICAL, command=self.logTextBox.yview)
@@ -365,21 +1122,347 @@ class MainAppWindow(tk.Tk):
         self.statusBar.pack(side=tk.BOTTOM, fill=tk.X)
         self.tablePopulation = tk.StringVar(self)
         ttk.Label(self.statusBar, textvariable=self.tablePopulation).pack(side='left', padx=5)
+        #Progress bar is only packed while records stream into the table
+        self.loadProgress = ttk.Progressbar(self.statusBar, orient=tk.HORIZONTAL, length=200, mode='determinate')
+        #Backup progress bar is only packed while a backup runs, VACUUM INTO does not report progress so it only shows activity
+        self.backupProgress = ttk.Progressbar(self.statusBar, orient=tk.HORIZONTAL, length=100, mode='indeterminate')
         self.filterIndicator = tk.StringVar(self, 'Current Filters: None')
         ttk.Label(self.statusBar, textvariable=self.filterIndicator).pack(side='right', padx=5)
     
-    # Method for populating the table initially, or refreshing the vehicle table after adding, deleting, and modifying records
-    def PopulateVehicleTable(self, dbEntries):
+    # Method for populating the table initially, or refreshing the vehicle table after the filter or sort order changes
+    # The first page of records is inserted right away, the rest streams in on a background thread
+    def PopulateVehicleTable(self):
+        self.StopLoading()
         self.vehicleTable.selection_remove(self.vehicleTable.selection())
         for item in self.vehicleTable.get_children():
             self.vehicleTable.delete(item)
-        for entry in dbEntries:
-            self.vehicleTable.insert('', tk.END, values=entry)
-        
-        #Status bar updates whenever we re-populate the table
-        display_pop = len(dbEntries)
-        total_pop = len(self.database.SelectAllRecords())
-        self.tablePopulation.set('Displaying {} out of {} database records.'.format(display_pop, total_pop))
+        self.rowKeys = []
+        self.rowKeyById = {}
+
+        self.lastRow = None
+        field_pairs, value_list = self.activeFilter
+        result = self.database.SelectPage(field_pairs, value_list, self.sortIndex, self.sortDescending)
+        if isinstance(result, Error):
+            self.hasMoreRows = False
+            return
+        self.InsertRows(result)
+        self.hasMoreRows = len(result) == PAGE_SIZE
+        self.UpdateStatusBar()
+
+        if self.hasMoreRows:
+            self.StartLoading()
+
+    # Append records to the end of the table
+    # Records the change journal already moved into the table are newer than streamed copies, so existing IDs are skipped
+    def InsertRows(self, records):
+        for entry in records:
+            #The treeview item ID is the v_num so rows can be found again without searching the table
+            if entry[0] not in self.rowKeyById:
+                self.vehicleTable.insert('', tk.END, iid=entry[0], values=entry[:len(fields)])
+                key = self.database.SortKey(entry, self.sortIndex)
+                self.rowKeys.append(key)
+                self.rowKeyById[entry[0]] = key
+        if len(records) > 0:
+            self.lastRow = records[-1]
+
+    # Start a background thread streaming the records after self.lastRow
+    def StartLoading(self):
+        self.loadGeneration += 1
+        self.stopEvent = threading.Event()
+        self.loadSeq = self.database.GetLastChangeSeq()
+        self.loadStart = time.perf_counter()
+
+        self.loadProgress['maximum'] = max(self.displayPopulation, 1)
+        self.loadProgress['value'] = len(self.rowKeys)
+        self.loadProgress.pack(side='left', padx=5)
+
+        field_pairs, value_list = self.activeFilter
+        args = (field_pairs, value_list, self.sortIndex, self.sortDescending, self.lastRow, self.rowQueue, self.loadGeneration, self.stopEvent)
+        threading.Thread(target=self.database.StreamRecords, args=args, daemon=True).start()
+        self.after(RECEIVE_INTERVAL, self.ReceiveRows, self.loadGeneration)
+
+    # Stop a running load, its remaining chunks are discarded by their generation
+    def StopLoading(self):
+        self.stopEvent.set()
+        self.loadGeneration += 1
+        self.loadProgress.pack_forget()
+
+    # Insert the chunks streamed so far and reschedule itself until the load finishes
+    # Only a few chunks are inserted per call so the window keeps responding while a large table loads
+    def ReceiveRows(self, generation):
+        if generation != self.loadGeneration:
+            return
+
+        for i in range(4):
+            try:
+                chunk_generation, records = self.rowQueue.get_nowait()
+            except queue.Empty:
+                break
+            if chunk_generation != generation:
+                continue
+            if records is None or isinstance(records, Error):
+                self.FinishLoading(records)
+                return
+            self.InsertRows(records)
+            self.loadProgress['value'] = len(self.rowKeys)
+
+        self.after(RECEIVE_INTERVAL, self.ReceiveRows, generation)
+
+    # Hide the progress bar and log the load time
+    #   error: the Error from the background thread, or None if every record was loaded
+    def FinishLoading(self, error):
+        self.hasMoreRows = False
+        self.loadProgress.pack_forget()
+        if error is not None:
+            self.Log('Error loading records: ' + str(error))
+            return
+        self.Log('Loaded {} records in {:.2f} seconds.'.format(len(self.rowKeys), time.perf_counter() - self.loadStart))
+
+        #Records changed while streaming may have arrived with their old values, so they are patched again
+        changes = self.database.SelectChangesSince(self.loadSeq)
+        if changes is not None and not isinstance(changes, Error) and len(changes) > 0:
+            self.PatchTableRows(list(dict.fromkeys(change[1] for change in changes)))
+
+    # Log the time from creating the window to the first idle moment of the event loop, when the dashboard is usable
+    def ReportStartup(self):
+        self.Log('Dashboard ready in {:.0f} ms.'.format((time.perf_counter() - self.startTime) * 1000))
+
+    # Status bar updates whenever we re-populate or patch the table
+    def UpdateStatusBar(self):
+        field_pairs, value_list = self.activeFilter
+        display_pop = self.database.CountRecords(field_pairs, value_list)
+        total_pop = self.database.CountSummary([])
+        if not isinstance(display_pop, Error):
+            self.displayPopulation = display_pop
+        status = 'Displaying {} out of {} database records'.format(display_pop, total_pop)
+
+        #The table only shows the edited file, department files are counted here
+        if len(self.database.db_paths) > 1:
+            all_pop = self.database.CountAllRecords(field_pairs, value_list)
+            status += ', {} match in all {} databases'.format(all_pop, len(self.database.db_paths))
+        self.tablePopulation.set(status + '.')
+        self.UpdateStatistics()
+
+    # Check the change journal for changes made since the last check and reschedule itself
+    def PollChanges(self):
+        self.RefreshChangedRows()
+        self.after(POLL_INTERVAL, self.PollChanges)
+
+    # Apply the journaled changes since self.changeSeq to the table and open inspectors, only the changed rows are queried
+    # Windows call this after writing to the database so their own changes show up without reloading the table
+    def RefreshChangedRows(self):
+        changes = self.database.SelectChangesSince(self.changeSeq)
+        if changes is None:
+            self.Log('Missed changes were pruned from the change journal. Reloading the vehicle table...')
+            self.changeSeq = self.database.GetLastChangeSeq()
+            self.PopulateVehicleTable()
+            return
+        if isinstance(changes, Error) or len(changes) == 0:
+            return
+        self.changeSeq = changes[-1][0]
+
+        #Several changes to one record only need its latest values
+        changed_ids = list(dict.fromkeys(change[1] for change in changes))
+        if len(changed_ids) > PATCH_LIMIT:
+            self.Log('{} records changed. Reloading the vehicle table...'.format(len(changed_ids)))
+            self.PopulateVehicleTable()
+        else:
+            self.PatchTableRows(changed_ids)
+
+        changed = set(changed_ids)
+        inspected_ids = [int(inspector.record_id) for inspector in self.openInspectors if int(inspector.record_id) in changed]
+        if len(inspected_ids) == 0:
+            return
+        records = self.database.SelectRecords(inspected_ids)
+        if isinstance(records, Error):
+            return
+        records = {record[0]: record for record in records}
+        for inspector in list(self.openInspectors):
+            if int(inspector.record_id) in changed:
+                inspector.OnRecordChanged(records.get(int(inspector.record_id)))
+
+    # Patch the table rows of the changed records and update the status bar
+    def PatchTableRows(self, changed_ids):
+        field_pairs, value_list = self.activeFilter
+        matching = self.database.SelectRecords(changed_ids, field_pairs, value_list)
+        if isinstance(matching, Error):
+            return
+
+        matching = {record[0]: record for record in matching}
+        for id in changed_ids:
+            self.PatchTableRow(id, matching.get(id))
+        self.UpdateStatusBar()
+
+    # Move a changed record to its sorted position in the table, or remove it if it was deleted or no longer matches the filter
+    #   record: the current record, or None if it should not be displayed
+    def PatchTableRow(self, id, record):
+        isDisplayed = id in self.rowKeyById
+        if isDisplayed:
+            del self.rowKeys[self.FindRowPosition(self.rowKeyById.pop(id))]
+
+        #The table holds the sorted records up to self.lastRow, a record sorting past it arrives with the streamed records
+        if record is not None:
+            key = self.database.SortKey(record, self.sortIndex)
+            if self.hasMoreRows:
+                last_key = self.database.SortKey(self.lastRow, self.sortIndex)
+                if (key < last_key) if self.sortDescending else (key > last_key):
+                    record = None
+
+        if record is None:
+            if isDisplayed:
+                self.vehicleTable.delete(id)
+            return
+
+        position = self.FindRowPosition(key)
+        self.rowKeys.insert(position, key)
+        self.rowKeyById[id] = key
+        if isDisplayed:
+            self.vehicleTable.item(id, values=record[:len(fields)])
+            self.vehicleTable.move(id, '', position)
+        else:
+            self.vehicleTable.insert('', position, iid=id, values=record[:len(fields)])
+
+    # Binary search self.rowKeys for the table position of a sort key, the number of rows that sort before it
+    def FindRowPosition(self, key):
+        low = 0
+        high = len(self.rowKeys)
+        while low < high:
+            middle = (low + high) // 2
+            if (self.rowKeys[middle] > key) if self.sortDescending else (self.rowKeys[middle] < key):
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    # Read the count for the statistics panel selections from the summary table
+    def UpdateStatistics(self):
+        criteria = []
+        for i in range(len(summary_columns)):
+            value = self.stats_vars[i].get()
+            if value != '':
+                criteria.append((summary_columns[i], value))
+
+        count = self.statsDatabase.CountSummary(criteria)
+        if isinstance(count, Error):
+            self.statsCount.set('Statistics unavailable')
+        elif count == 1:
+            self.statsCount.set('1 matching vehicle')
+        else:
+            self.statsCount.set('{} matching vehicles'.format(count))
+
+    # Write the vehicles matching the active filter in every database file to a CSV file, in the table's sort order
+    # The header uses the field labels, after a Database column naming the file each vehicle came from
+    # Each department file numbers its vehicles on its own, so only vehicles from the edited file keep their Vehicle #
+    def ExportRecords(self):
+        filename = filedialog.asksaveasfilename(title='Export Vehicles', initialfile='fleet-export.csv', defaultextension='.csv', filetypes=[('CSV files', '*.csv'), ('All files', '*.*')], parent=self)
+        if not filename:
+            return
+
+        export_start = time.perf_counter()
+        field_pairs, value_list = self.activeFilter
+        result = self.database.FilterRecords(field_pairs, value_list, self.sortIndex, self.sortDescending)
+        if isinstance(result, Error):
+            showerror(title='Error', message='There was a problem searching the databases: ' + str(result) + '.', parent=self)
+            return
+
+        try:
+            with open(filename, 'w', newline='') as export:
+                writer = csv.writer(export)
+                writer.writerow(['Database'] + [field['label'] for field in fields])
+                for db_path, record in result:
+                    v_num = record[0] if db_path == self.database.db_path else ''
+                    writer.writerow((db_path, v_num) + record[1:len(fields)])
+        except OSError as e:
+            showerror(title='Error', message='The export could not be written: ' + str(e) + '.', parent=self)
+            return
+        self.Log('Exported {} vehicles from {} databases in {:.2f} seconds.'.format(len(result), len(self.database.db_paths), time.perf_counter() - export_start))
+
+    # Read the statistics from a read-only snapshot chosen by the user, or go back to the live database if a snapshot is open
+    # Snapshot queries use their own file, so they never wait on the live database
+    def ToggleSnapshot(self):
+        if self.statsDatabase is not self.database:
+            self.Log('Closed snapshot ' + self.statsDatabase.db_path)
+            self.statsDatabase.Close()
+            self.statsDatabase = self.database
+            self.statsFrame['text'] = 'Fleet Statistics'
+            self.snapshotButton['text'] = 'Open Snapshot'
+        else:
+            filename = filedialog.askopenfilename(title='Open Snapshot', filetypes=[('Database files', '*.db'), ('All files', '*.*')], parent=self)
+            if not filename:
+                return
+            snapshot = DataInterface(filename, self, read_only=True)
+            if snapshot.conn is None:
+                showerror(title='Error', message='The snapshot could not be opened, see the log for details.', parent=self)
+                return
+            self.statsDatabase = snapshot
+            self.statsFrame['text'] = 'Fleet Statistics (snapshot ' + pathlib.Path(filename).name + ')'
+            self.snapshotButton['text'] = 'Close Snapshot'
+        self.UpdateStatistics()
+
+    # Copy the live database to a file chosen by the user on a background thread, see DataInterface.BackupDatabase()
+    # The window keeps responding and the database can still be edited while the copy runs
+    def BackUpDatabase(self):
+        filename = filedialog.asksaveasfilename(title='Back Up Database', initialfile=time.strftime('fleet-%Y%m%d-%H%M%S.db'), defaultextension='.db', filetypes=[('Database files', '*.db'), ('All files', '*.*')], parent=self)
+        if not filename:
+            return
+        if pathlib.Path(filename).resolve() == pathlib.Path(self.database.db_path).resolve():
+            showwarning(title='Warning', message='The backup cannot replace the live database.', parent=self)
+            return
+
+        self.backupButton['state'] = tk.DISABLED
+        self.backupProgress.pack(side='left', padx=5)
+        self.backupProgress.start()
+        self.backupQueue = queue.Queue()
+        self.backupStart = time.perf_counter()
+        self.Log('Backing up the database to ' + filename + '...')
+        threading.Thread(target=self.database.BackupDatabase, args=(filename, self.backupQueue), daemon=True).start()
+        self.after(BACKUP_INTERVAL, self.CheckBackup, filename)
+
+    # Check for the result of the backup and reschedule itself until the backup finishes
+    def CheckBackup(self, filename):
+        try:
+            error = self.backupQueue.get_nowait()
+        except queue.Empty:
+            self.after(BACKUP_INTERVAL, self.CheckBackup, filename)
+            return
+        self.FinishBackup(filename, error)
+
+    # Hide the backup progress bar and report the result
+    #   error: the Error or OSError from the background thread, or None if the backup is complete
+    def FinishBackup(self, filename, error):
+        self.backupQueue = None
+        self.backupProgress.stop()
+        self.backupProgress.pack_forget()
+        self.backupButton['state'] = tk.NORMAL
+        if error is not None:
+            self.Log('Error backing up the database: ' + str(error))
+            showerror(title='Error', message='There was a problem backing up the database: ' + str(error) + '.', parent=self)
+            return
+        self.Log('Backed up the database to {} in {:.2f} seconds.'.format(filename, time.perf_counter() - self.backupStart))
+
+    # Event handler for clicking a heading, a second click on the same heading reverses the sort
+    def SortByColumn(self, sort_index):
+        if sort_index == self.sortIndex:
+            self.sortDescending = not self.sortDescending
+        else:
+            self.sortIndex = sort_index
+            self.sortDescending = False
+        self.UpdateSortIndicator()
+        self.Log('Sorting by {}{}...'.format(fields[sort_index]['label'], ' (descending)' if self.sortDescending else ''))
+        self.PopulateVehicleTable()
+
+    # Mark the sorted column heading with an arrow for the sort direction
+    def UpdateSortIndicator(self):
+        for i in range(len(fields)):
+            heading_text = fields[i]['label']
+            if i == self.sortIndex:
+                heading_text += ' \u25BC' if self.sortDescending else ' \u25B2'
+            self.vehicleTable.heading(i, text=heading_text)
+
+    # Set the active filter and repopulate the table, an empty filter shows every record
+    def ApplyFilter(self, field_pairs, value_list):
+        self.activeFilter = (field_pairs, value_list)
+        self.PopulateVehicleTable()
 
     # Method for printing strings to self.logTextBox
     def Log(self, entry):
@@ -389,9 +1472,9 @@ class MainAppWindow(tk.Tk):
         self.logTextBox['state'] = tk.DISABLED
         self.logLine += 1
     
-    # Instantiate a new filter window and pass a reference to self
+    # Open a new filter window and pass a reference to self
     def OpenFilterWindow(self):
-        self.filterWindow = FilterWindow(self)
+        self.filterWindow = FilterWindow.Open(self)
     
     # Method to handle the status of the filter, hiding and showing the filter window appropriately
     def FilterWindowHandler(self, filterStatus):
@@ -413,8 +1496,8 @@ class MainAppWindow(tk.Tk):
         #After clicking the clear filter button
         elif filterStatus == 'clearing':
             self.Log('Clearing filters...')
-            self.filterWindow.destroy()
-            self.PopulateVehicleTable(self.database.SelectAllRecords())
+            self.filterWindow.Close()
+            self.ApplyFilter([], [])
             self.modifyFilterButton['state'] = tk.DISABLED
             self.clearFilterButton['state'] = tk.DISABLED
             self.newFilterButton['state'] = tk.NORMAL
@@ -440,9 +1523,11 @@ class MainAppWindow(tk.Tk):
         if self.isListSelected:
             self.inspectVehicleButton['state'] = tk.NORMAL
             self.deleteVehicleButton['state'] = tk.NORMAL
+            self.batchEditButton['state'] = tk.NORMAL
         else:
             self.inspectVehicleButton['state'] = tk.DISABLED
             self.deleteVehicleButton['state'] = tk.DISABLED
+            self.batchEditButton['state'] = tk.DISABLED
     
     # Method called by the Delete Selected Record button
     # Can handle whether a single or multiple records were selected for deletion
@@ -454,7 +1539,7 @@ class MainAppWindow(tk.Tk):
                     result = self.database.DeleteRecord(id)
                     if result == None:
                         showinfo(title='Record deleted', message='Vehicle # {} was successfully deleted.'.format(id), parent=self)
-                        self.PopulateVehicleTable(self.database.SelectAllRecords())
+                        self.RefreshChangedRows()
                     else:
                         raise DatabaseError
             except DatabaseError:
@@ -464,13 +1549,16 @@ class MainAppWindow(tk.Tk):
 
     # Event handler method for double clicking a row in the treeview vehicle list
     def DoubleClickInspect(self, event):
+        #Double clicking a heading to reverse the sort also reaches this handler, only double clicks on rows inspect
+        if self.vehicleTable.identify_region(event.x, event.y) != 'cell':
+            return
         for id in self.selected_ids:
-            InspectRecordWindow(self, id)
+            InspectRecordWindow.Open(self, id)
     
     # Method for the inspectVehicleButton
     def InspectSelectedRecords(self):
         for id in self.selected_ids:
-            InspectRecordWindow(self, id)
+            InspectRecordWindow.Open(self, id)
     
     # Method for the Inspect by Vehicle # button
     def InspectByIdDialog(self):
@@ -478,44 +1566,260 @@ class MainAppWindow(tk.Tk):
         
         if answer is not None:
             if self.database.SelectRecord(answer) is not None:
-                InspectRecordWindow(self,str(answer))
+                InspectRecordWindow.Open(self,str(answer))
             else:
                 showwarning(title='Warning', message='Record does not exist', parent=self)
         else:
             return
     
+    # Method for the Import Roster button, adds or updates vehicles by VIN from a CSV file
+    # The header row names each column by its column name or label, a VIN column is required
+    def ImportRoster(self):
+        filename = filedialog.askopenfilename(title='Import Roster', filetypes=[('CSV files', '*.csv'), ('All files', '*.*')], parent=self)
+        if not filename:
+            return
+
+        try:
+            with open(filename, newline='') as roster:
+                reader = csv.reader(roster)
+                header = next(reader, [])
+                rows = list(reader)
+        except (OSError, csv.Error) as e:
+            showerror(title='Error', message='The roster could not be read: ' + str(e) + '.', parent=self)
+            return
+
+        #Match the header to fields, unknown columns are ignored
+        columns = []
+        indexes = []
+        for i in range(len(header)):
+            for field in fields:
+                if header[i].strip().lower() in (field['column'].lower(), field['label'].lower()):
+                    columns.append(field['column'])
+                    indexes.append(i)
+                    break
+        if 'vin' not in columns:
+            showwarning(title='Warning', message='The roster must have a VIN column.', parent=self)
+            return
+
+        #Exports name the file each vehicle came from, only rows from the edited file are imported
+        database_index = None
+        for i in range(len(header)):
+            if header[i].strip().lower() == 'database':
+                database_index = i
+                break
+        db_path = pathlib.Path(self.database.db_path).resolve()
+        other_rows = 0
+
+        #Rows without a VIN cannot be matched to a vehicle and are skipped, blank vehicle numbers are assigned by the database
+        vin_index = indexes[columns.index('vin')]
+        values = []
+        for row in rows:
+            if database_index is not None:
+                if len(row) <= database_index or row[database_index].strip() == '' or pathlib.Path(row[database_index].strip()).resolve() != db_path:
+                    other_rows += 1
+                    continue
+            if len(row) <= vin_index or row[vin_index].strip() == '':
+                continue
+            record = [row[i] if i < len(row) else '' for i in indexes]
+            if 'v_num' in columns and record[columns.index('v_num')] == '':
+                record[columns.index('v_num')] = None
+            values.append(record)
+        skipped = len(rows) - len(values) - other_rows
+
+        #Check every VIN, filling in blank years and makes when the roster has those columns
+        self.Log('Checking {} VINs...'.format(len(values)))
+        check_start = time.perf_counter()
+        year_column = columns.index('year') if 'year' in columns else None
+        make_column = columns.index('make') if 'make' in columns else None
+        vin_column = columns.index('vin')
+        vin_rows = [(record[vin_column],
+                     record[year_column] if year_column is not None else None,
+                     record[make_column] if make_column is not None else None) for record in values]
+        problem_rows = 0
+        for record, (problems, year, make) in zip(values, CheckVINs(vin_rows)):
+            if year_column is not None:
+                record[year_column] = year
+            if make_column is not None:
+                record[make_column] = make
+            if problems:
+                problem_rows += 1
+                if problem_rows <= 10:
+                    self.Log('VIN ' + record[vin_column] + ': ' + '; '.join(problems) + '.')
+        self.Log('Checked {} VINs in {:.2f} seconds.'.format(len(values), time.perf_counter() - check_start))
+        if problem_rows > 0:
+            answer = askyesno(title='Check the VINs', message='{} of {} rows have an invalid VIN or a year or make that does not match the VIN, see the log for examples. Do you want to import them anyway?'.format(problem_rows, len(values)), icon=WARNING, parent=self)
+            if not answer:
+                return
+
+        self.Log('Importing {} vehicles from {}...'.format(len(values), filename))
+        result = self.database.UpsertRecords(columns, values)
+        if isinstance(result, Error):
+            showerror(title='Error', message='There was a problem importing the roster, no vehicles were changed: ' + str(result) + '.', parent=self)
+            return
+
+        inserted, updated, unchanged = result
+        message = '{} vehicles added, {} updated, {} unchanged.'.format(inserted, updated, unchanged)
+        if skipped > 0:
+            message += ' {} rows without a VIN were skipped.'.format(skipped)
+        if other_rows > 0:
+            message += ' {} rows from other databases were skipped.'.format(other_rows)
+        showinfo(title='Import complete', message=message, parent=self)
+        self.RefreshChangedRows()
+
     # Method Run() is called in the __main__ program to start the program
     def Run(self):
         self.CreateDashboard()
         self.LinkDatabase()
         self.CenterWindow()
-        self.PopulateVehicleTable(self.database.SelectAllRecords())
+        self.changeSeq = self.database.GetLastChangeSeq()
+        self.PopulateVehicleTable()
+        self.after(POLL_INTERVAL, self.PollChanges)
+        self.after_idle(self.ReportStartup)
         self.mainloop()
 
+#################################################
+#| Shared Form and Pooled Window Classes       |#
+#################################################
+
+# RecordForm is the fields-driven grid of labels and input widgets shared by every child window
+# Each window builds its form once, then re-binds values into the form's StringVars whenever the window is reused
+#   field_indexes: indexes into fields of the rows to show, in order
+#   checkNumbers: bool to remove non-numeric input from 'number' fields
+#   onChange: optional method called with the form row whenever the user changes a value
+
+class RecordForm(ttk.LabelFrame):
+    def __init__(self, parent, field_indexes, checkNumbers=False, onChange=None):
+        super().__init__(parent, text='Fields')
+        self.field_indexes = list(field_indexes)
+        self.checkNumbers = checkNumbers
+        self.onChange = onChange
+
+        #Bool set while the program sets values, so the traces only react to user input
+        self.isBinding = False
+
+        #Style used to change a label to red when its field is modified
+        ttk.Style().configure('modified.TLabel', foreground='red')
+
+        #Lists for the labels, string variables, and widgets, one entry per form row
+        self.field_labels = []
+        self.string_vars = []
+        self.form_widgets = []
+
+        for row, i in enumerate(self.field_indexes):
+            self.field_labels.append(ttk.Label(self, text=fields[i]['label']))
+            self.field_labels[row].grid(row=row, column=0, padx=5, pady=5, sticky=tk.W)
+            self.string_vars.append(tk.StringVar(self, ''))
+
+            #Widget types are determined by the 'search_by' key
+            if(fields[i]['search_by'] == 'dropdown'):
+                dropdown = fields[i]['dropdown_values']
+                self.form_widgets.append(ttk.Combobox(self, width=fields[i]['dropdown_width'], textvariable=self.string_vars[row], values=dropdown, state='readonly'))
+                self.form_widgets[row].grid(row=row, column=1, padx=5, pady=5, sticky=tk.W)
+            elif(fields[i]['search_by'] == 'radio'):
+                self.form_widgets.append(ttk.Frame(self))
+                self.form_widgets[row].grid(row=row, column=1, padx=5, pady=5, sticky=tk.W)
+                for radio_value in fields[i]['radio_values']:
+                    ttk.Radiobutton(self.form_widgets[row], text=radio_value, value=radio_value, variable=self.string_vars[row]).pack(padx=5, pady=5, side='left')
+            else:
+                self.form_widgets.append(ttk.Entry(self, width=fields[i]['entry_width'], textvariable=self.string_vars[row]))
+                self.form_widgets[row].grid(row=row, column=1, padx=5, pady=5, sticky=tk.W)
+
+            self.string_vars[row].trace('w', lambda a, b, c, form_row=row : self.OnTrace(form_row))
+
+    # Trace callback shared by every StringVar
+    def OnTrace(self, form_row):
+        if self.isBinding:
+            return
+        if self.checkNumbers:
+            self.NumberChecker(form_row)
+        if self.onChange is not None:
+            self.onChange(form_row)
+
+    # Check the number input for invalid characters and delete them
+    def NumberChecker(self, form_row):
+        current_string = self.string_vars[form_row].get()
+        if fields[self.field_indexes[form_row]]['type'] == 'number':
+            if len(current_string) > 0 and not current_string.isnumeric():
+                if len(current_string) == 1:
+                    self.string_vars[form_row].set('')
+                else:
+                    self.string_vars[form_row].set(current_string[0:-1])
+                showwarning(title='Warning', message='This field can only contain numbers', parent=self)
+
+    # Set every form value without calling onChange and reset the labels to the unmodified style
+    def SetValues(self, values):
+        self.isBinding = True
+        for row in range(len(self.string_vars)):
+            self.string_vars[row].set(values[row])
+            self.field_labels[row]['style'] = 'TLabel'
+        self.isBinding = False
+
+    # Get the list of form values in form row order
+    def GetValues(self):
+        return [string_var.get() for string_var in self.string_vars]
+
+    # Clears the fields of any input by the user, starting at form row first_row
+    def ClearFields(self, first_row=0):
+        for row in range(first_row, len(self.string_vars)):
+            self.string_vars[row].set('')
+
+    # Change the label color of a modified field
+    def MarkModified(self, form_row):
+        self.field_labels[form_row]['style'] = 'modified.TLabel'
+
+    # Prevent user entry in a form row, the value can still be set by the program
+    def DisableRow(self, form_row):
+        self.form_widgets[form_row]['state'] = tk.DISABLED
+
+# PooledWindow is the base class of the child windows
+# Closing a window withdraws it and keeps it for reuse, so its widgets are only ever built once
+# Subclasses build their widgets in __init__(parent) and reset them for each use in Bind()
+# Windows are opened with the class method Open() and closed with Close()
+
+class PooledWindow(tk.Toplevel):
+    # Withdrawn windows waiting to be reused, keyed by window class
+    pools = {}
+
+    @classmethod
+    def Open(cls, parent, *args):
+        pool = PooledWindow.pools.setdefault(cls, [])
+        if len(pool) > 0:
+            window = pool.pop()
+            window.deiconify()
+        else:
+            window = cls(parent)
+        window.Bind(*args)
+        return window
+
+    # Withdraw the window into the pool, windows beyond POOL_SIZE are destroyed
+    def Close(self):
+        self.grab_release()
+        pool = PooledWindow.pools.setdefault(type(self), [])
+        if len(pool) < POOL_SIZE:
+            self.withdraw()
+            pool.append(self)
+        else:
+            self.destroy()
+
 #################################################
 #| Table Filter Top Window Class               |#
 #################################################
 
-# The code is structured for one FilterWindow class to be instantiated at a time
-# The instantiated FilterWindow class is assigned to the variable self.filterWindow
+# The code is structured for one FilterWindow class to be opened at a time
+# The opened FilterWindow class is assigned to the variable self.filterWindow
 # Functions can then be called on that instance from MainAppWindow
-class FilterWindow(tk.Toplevel):
+class FilterWindow(PooledWindow):
     global fields
 
     def __init__(self, parent):
         super().__init__(parent)
         self.parent = parent
-        
+
         #Set window properties
         self.title('List Filter')
         self.resizable(False, False)
-        self.focus_set()
-        self.grab_set()
         self.protocol('WM_DELETE_WINDOW', self.ConfirmCancel)
 
-        #Initialize an instance variable to track the status of the filter
-        self.filterStatus = 'new'
-
         self.CreateFilterForm()
 
     def CreateFilterForm(self):
@@ -524,47 +1828,27 @@ class FilterWindow(tk.Toplevel):
         header_text = 'Enter values to filter the vehicle list. Use "%" as a wildcard placeholder.'
         ttk.Label(formHeaderFrame, text=header_text).pack(padx=5, pady=5, fill='x')
 
-        formFrame = ttk.LabelFrame(self, text='Fields')
-        formFrame.pack(padx=5, pady=(5,10), fill='x')
-
-        #Loop through fields and generate labels with text from the ['label'] key for each field dictionary
-        for i in range(len(fields)):
-            ttk.Label(formFrame, text=fields[i]['label']).grid(row=i, column=0, padx=5, pady=5, sticky=tk.W)
-        
-        #List for storing the string variables in the widgets
-        self.string_vars = []
-        #List variable for storing references to the widget objects
-        self.form_widgets = []
-
-        #Create the string variables and widgets and append them to the lists
-        for i in range(len(fields)):
-            self.string_vars.append(tk.StringVar(self, ''))
-
-            #Widget types are determined by the 'search_by' key
-            if(fields[i]['search_by'] == 'dropdown'):
-                dropdown = fields[i]['dropdown_values']
-                self.form_widgets.append(ttk.Combobox(formFrame, width=fields[i]['dropdown_width'], textvariable=self.string_vars[i], values=dropdown, state='readonly'))
-                self.form_widgets[i].grid(row=i, column=1, padx=5, pady=5, sticky=tk.W)
-            elif(fields[i]['search_by'] == 'radio'):
-                self.form_widgets.append(ttk.Frame(formFrame))
-                self.form_widgets[i].grid(row=i, column=1, padx=5, pady=5, sticky=tk.W)
-                for radio_value in fields[i]['radio_values']:
-                    ttk.Radiobutton(self.form_widgets[i], text=radio_value, value=radio_value, variable=self.string_vars[i]).pack(padx=5, pady=5, side='left')
-            else:
-                self.form_widgets.append(ttk.Entry(formFrame, width=fields[i]['entry_width'], textvariable=self.string_vars[i]))
-                self.form_widgets[i].grid(row=i, column=1, padx=5, pady=5, sticky=tk.W)
+        self.form = RecordForm(self, range(len(fields)))
+        self.form.pack(padx=5, pady=(5,10), fill='x')
 
         buttonFrame = ttk.Frame(self)
         buttonFrame.pack(padx=5, pady=5, fill='x')
         ttk.Button(buttonFrame, text='Clear Fields', command=self.ClearFields).pack(side='left')
         ttk.Button(buttonFrame, text='Submit', command=self.BuildValues).pack(side='right')
         ttk.Button(buttonFrame, text='Cancel', command=self.ConfirmCancel).pack(side='right')
-    
+
+    # Reset the window for a new filter, called by Open()
+    def Bind(self):
+        #Initialize an instance variable to track the status of the filter
+        self.filterStatus = 'new'
+        self.ClearFields()
+        self.focus_set()
+        self.grab_set()
+
     # Clears each field of any input by the user
     def ClearFields(self):
-        for i in range(len(self.string_vars)):
-            self.string_vars[i].set('')
-    
+        self.form.ClearFields()
+
     # Assembles each StringVar into a format that works with the database method FilterRecords()
     def BuildValues(self):
         #field_pairs contains a list of tuple pairs indicating the column type and if the search uses a wildcard or not
@@ -575,10 +1859,11 @@ class FilterWindow(tk.Toplevel):
         self.query_columns = []
 
         self.parent.Log('Building filter query...')
-        
+
         #Loop through all StringVar values and append only non-empty values
-        for i in range(len(self.string_vars)):
-            value = self.string_vars[i].get()
+        form_values = self.form.GetValues()
+        for i in range(len(form_values)):
+            value = form_values[i]
             if value == '':
                 continue
             else:
@@ -592,7 +1877,7 @@ class FilterWindow(tk.Toplevel):
                 else:
                     #For any other column (i.e. dropdowns and radio buttons), we don't need a wildcard search, so the tuple pair is always column name and False
                     field_pairs.append((fields[i]['column'], False))
-                
+
                 value_list.append(value)
                 self.query_columns.append((fields[i]['label']))
 
@@ -601,26 +1886,31 @@ class FilterWindow(tk.Toplevel):
             return
         else:
             self.RunQuery(field_pairs, value_list)
-    
+
     # Send the built lists to main window app, main window app populates vehicle table
     def RunQuery(self, field_pairs, value_list):
         try:
-            result = self.parent.database.FilterRecords(field_pairs, value_list)
-            if result == None:
+            #Only the number of matches is needed here, the table fetches the records one page at a time
+            #Matches in department files count too, even though the table only shows the edited file
+            result = self.parent.database.CountAllRecords(field_pairs, value_list)
+            if isinstance(result, Error):
+                raise DatabaseError
+            elif result == 0:
                 none_msg = 'No records matched the filter. Try narrowing your search or use wildcards.'
                 showinfo(title='No results', message=none_msg, parent=self)
                 return
             else:
-                self.parent.PopulateVehicleTable(result)
+                self.parent.Log('The query returned {} records in {} databases.'.format(result, len(self.parent.database.db_paths)))
+                self.parent.ApplyFilter(field_pairs, value_list)
                 self.filterStatus = 'executed'
                 self.parent.FilterWindowHandler(self.filterStatus)
         except DatabaseError:
             showerror(title='Error', message='There was a problem filtering the database: ' + str(result) + '.')
-    
+
     # Method called by main app window to update the status bar
     def GetQueryIndicator(self):
         return ', '.join(self.query_columns)
-    
+
     # Handling of the cancel/close buttons is required to ensure logical functioning of the filter window
     def ConfirmCancel(self):
         answer = askyesno(title='Cancel entry?', message='Are you sure you want to cancel the filter?', icon=WARNING, parent=self)
@@ -630,7 +1920,7 @@ class FilterWindow(tk.Toplevel):
                 self.parent.FilterWindowHandler(self.filterStatus)
                 return
             else:
-                self.destroy()
+                self.Close()
         else:
             return
 
@@ -638,122 +1928,123 @@ class FilterWindow(tk.Toplevel):
 #| Inspect Record Top Window Class             |#
 #################################################
 
-# As with the FilterWindow, InspectRecordWindow inherits from Toplevel and is called by the parent main app when needed
-# Multiple instances of InspectRecordWindow can be instantiated (i.e. user selected multiple rows and clicked the Inspect Selected Vehicle button)
+# As with the FilterWindow, InspectRecordWindow is a pooled Toplevel opened by the parent main app when needed
+# Multiple instances of InspectRecordWindow can be open at once (i.e. user selected multiple rows and clicked the Inspect Selected Vehicle button)
 # Creating the form, assembling values, and sending values to the database largely follows the same logic as in the filter window
 
-class InspectRecordWindow(tk.Toplevel):
-    def __init__(self, parent, id):
+class InspectRecordWindow(PooledWindow):
+    def __init__(self, parent):
         super().__init__(parent)
-        self.title('Record Inspector - Vehicle # ' + str(id))
         self.protocol('WM_DELETE_WINDOW', self.ConfirmCancel)
         self.resizable(False, False)
-        
-        self.parent = parent
-        self.record_id = id
 
-        self.parent.Log('Opened Vehicle #' + str(self.record_id) + ' for inspection.')
+        self.parent = parent
 
         self.CreateInspectionForm()
-    
-    def CreateInspectionForm(self):
-        #Track modification of form and change style if modified
-        self.modified = False
-        self.style = ttk.Style()
-        self.style.configure('modified.TLabel', foreground='red')
 
+    def CreateInspectionForm(self):
         formHeaderFrame = ttk.Frame(self)
         formHeaderFrame.pack(padx=5, pady=5, fill='x')
         header_text = 'Enter new values. Field labels change to red when modified.'
         ttk.Label(formHeaderFrame, text=header_text).pack(padx=5, pady=5, fill='x')
 
-        formFrame = ttk.LabelFrame(self, text='Fields')
-        formFrame.pack(padx=5, pady=(5,10), fill='x')
-
-        #List variable to store the column labels and reference later to change style after form is modified
-        self.field_labels = []
+        self.form = RecordForm(self, range(len(fields)), checkNumbers=True, onChange=self.OnFieldChange)
+        self.form.pack(padx=5, pady=(5,10), fill='x')
         for i in range(len(fields)):
-            self.field_labels.append(ttk.Label(formFrame, text=fields[i]['label']))
-            self.field_labels[i].grid(row=i, column=0, padx=5, pady=5, sticky=tk.W)
-        
-        self.string_vars = []
-        self.form_widgets = []
-
-        for i in range(len(fields)):
-            field_value = str(self.parent.database.GetRecordValue(fields[i]['column'], self.record_id))
-            self.string_vars.append(tk.StringVar(self, field_value))
-
-            if(fields[i]['search_by'] == 'dropdown'):
-                dropdown = fields[i]['dropdown_values']
-                self.form_widgets.append(ttk.Combobox(formFrame, width=fields[i]['dropdown_width'], textvariable=self.string_vars[i], values=dropdown, state='readonly'))
-                self.form_widgets[i].grid(row=i, column=1, padx=5, pady=5, sticky=tk.W)
-            elif(fields[i]['search_by'] == 'radio'):
-                self.form_widgets.append(ttk.Frame(formFrame))
-                self.form_widgets[i].grid(row=i, column=1, padx=5, pady=5, sticky=tk.W)
-                for radio_value in fields[i]['radio_values']:
-                    ttk.Radiobutton(self.form_widgets[i], text=radio_value, value=radio_value, variable=self.string_vars[i]).pack(padx=5, pady=5, side='left')
-            else:
-                self.form_widgets.append(ttk.Entry(formFrame, width=fields[i]['entry_width'], textvariable=self.string_vars[i]))
-                self.form_widgets[i].grid(row=i, column=1, padx=5, pady=5, sticky=tk.W)
-                if fields[i]['column'] == 'v_num' or fields[i]['column'] == 'vin':
-                    self.form_widgets[i]['state'] = tk.DISABLED
-            
-            self.string_vars[i].trace('w', lambda a, b, c, field_index=i : [self.OnFieldChange(a, b, c, field_index), self.NumberChecker(a, b, c, field_index)])
+            if fields[i]['column'] == 'v_num' or fields[i]['column'] == 'vin':
+                self.form.DisableRow(i)
 
         buttonFrame = ttk.Frame(self)
         buttonFrame.pack(padx=5, pady=5, fill='x')
         ttk.Button(buttonFrame, text='Delete Record', command=self.DeleteRecord).pack(side='left')
         ttk.Button(buttonFrame, text='Submit Changes', command=self.BuildValues).pack(side='right')
         ttk.Button(buttonFrame, text='Cancel', command=self.ConfirmCancel).pack(side='right')
-    
+
+    # Reset the window for the record to inspect, called by Open()
+    def Bind(self, id):
+        self.record_id = id
+        self.title('Record Inspector - Vehicle # ' + str(id))
+
+        #Register with the main window so changes from other windows or instances are applied to the form
+        self.parent.openInspectors.append(self)
+
+        self.parent.Log('Opened Vehicle #' + str(self.record_id) + ' for inspection.')
+
+        #Read the record once, the version it was read with guards the update against overwriting other changes
+        self.BindRecordValues(self.parent.database.SelectRecord(self.record_id))
+
     #Change the column label color if a field was modified
-    def OnFieldChange(self, a, b, c, field_index):
+    def OnFieldChange(self, field_index):
         self.modified = True
-        self.field_labels[field_index]['style'] = 'modified.TLabel'
-    
-    #Check the number input for invalid characters and delete them
-    def NumberChecker(self, a, b, c, field_index):
-        current_string = self.string_vars[field_index].get()
-        if fields[field_index]['type'] == 'number':
-            if not current_string.isnumeric():
-                if len(current_string) == 1:
-                    self.string_vars[field_index].set('')
-                else:
-                    self.string_vars[field_index].set(current_string[0:-1])
-                showwarning(title='Warning', message='This field can only contain numbers', parent=self)
-    
-    # Build a list with the correct order for the database function, then forward for user confirmation
+        self.changed_fields.add(field_index)
+        self.form.MarkModified(field_index)
+
+    # Build a list of (column, value) pairs for the modified fields, then forward for user confirmation
     def BuildValues(self):
         self.parent.Log('Building value changes...')
-        value_list = []
+        changes = []
+        form_values = self.form.GetValues()
 
-        for i in range(len(self.string_vars)):
-            value_list.append(self.string_vars[i].get())
-        
-        #The database function UpdateRecord requires the unique ID to be at the end of the list
-        id = value_list.pop(0)
-        value_list.append(id)
+        #Fields that were edited back to their original value are left out
+        for i in sorted(self.changed_fields):
+            if form_values[i] != self.record_values[i]:
+                changes.append((fields[i]['column'], form_values[i]))
+
+        if len(changes) == 0:
+            showinfo(title='No changes', message='None of the fields were changed.', parent=self)
+            return
+
+        self.AskChangeCancel(changes)
 
-        self.AskChangeCancel(value_list)
-    
     # Method confirms the user's intent to change the record
-    def AskChangeCancel(self, values):
+    # The update only succeeds if the record still has the version the form was read with, so concurrent edits are not lost
+    def AskChangeCancel(self, changes):
         answer = askokcancel(title='Submit the changes?', message='Click OK to commit the changes to the database.', icon=WARNING, parent=self)
         if answer:
-            #Check if record exists before proceeding
-            if self.parent.database.SelectRecord(str(values[-1])) is not None:
-                try:
-                    result = self.parent.database.UpdateRecord(values)
-                    if result == None:
-                        showinfo(title='Record updated', message='The database was updated successfully.', parent=self)
-                        self.parent.PopulateVehicleTable(self.parent.database.SelectAllRecords())
-                        self.destroy()
+            try:
+                result = self.parent.database.UpdateChangedColumns(self.record_id, self.record_version, changes)
+                if result == 1:
+                    showinfo(title='Record updated', message='The database was updated successfully.', parent=self)
+                    self.Close()
+                    self.parent.RefreshChangedRows()
+                elif result == 0:
+                    #Only a failed update needs to find out whether the record was changed or deleted
+                    if self.parent.database.SelectRecord(self.record_id) is None:
+                        showerror(title='Record missing', message='The inspected record no longer exists. Close the record inspector and clear any filters.', parent=self)
                     else:
-                        raise DatabaseError
-                except DatabaseError:
-                    showerror(title='Error', message='There was a problem modifying the record: ' + str(result) + '.', parent=self)
-            else:
-                showerror(title='Record missing', message='The inspected record no longer exists. Close the record inspector and clear any filters.', parent='self')
+                        showerror(title='Record changed', message='The record was changed by another user after it was opened. Close the record inspector and reopen the record to see the current values.', parent=self)
+                else:
+                    raise DatabaseError
+            except DatabaseError:
+                showerror(title='Error', message='There was a problem modifying the record: ' + str(result) + '.', parent=self)
+
+    # Called by the main window when the change journal shows the record changed
+    #   record: the current record values, or None if the record was deleted
+    def OnRecordChanged(self, record):
+        if record is None:
+            self.title('Record Inspector - Vehicle # ' + str(self.record_id) + ' (deleted)')
+            self.parent.Log('Vehicle #' + str(self.record_id) + ' was deleted while open for inspection.')
+            showwarning(title='Record deleted', message='The inspected record was deleted. Changes to it can no longer be submitted.', parent=self)
+        elif self.modified:
+            self.parent.Log('Vehicle #' + str(self.record_id) + ' was changed while being modified.')
+            showwarning(title='Record changed', message='The inspected record was changed by another user. Reopen the record to submit changes.', parent=self)
+        else:
+            self.BindRecordValues(record)
+
+    # Set the form to the record values and reset the modification tracking
+    # changed_fields holds the indexes of the modified fields, only those columns are written on submit
+    def BindRecordValues(self, record):
+        self.modified = False
+        self.changed_fields = set()
+        self.record_values = [str(value) for value in record[:len(fields)]]
+        self.record_version = record[len(fields)]
+        self.form.SetValues(self.record_values)
+
+    # Unregister from the main window when the inspector is closed
+    def Close(self):
+        if self in self.parent.openInspectors:
+            self.parent.openInspectors.remove(self)
+        super().Close()
 
     def DeleteRecord(self):
         answer = askyesno(title='Delete record?', message='Are you sure you want to delete the selected records? You cannot undo this action.', icon=WARNING)
@@ -762,42 +2053,40 @@ class InspectRecordWindow(tk.Toplevel):
                 result = self.parent.database.DeleteRecord(self.record_id)
                 if result == None:
                     showinfo(title='Record deleted', message='Vehicle # {} was successfully deleted.'.format(self.record_id), parent=self)
-                    self.parent.PopulateVehicleTable(self.parent.database.SelectAllRecords())
-                    self.destroy()
+                    self.Close()
+                    self.parent.RefreshChangedRows()
                 else:
                     raise DatabaseError
             except DatabaseError:
                 showwarning(title='Error', message='A record could not be deleted. No further actions will be taken.', parent=self)
-    
+
     # Confirm cancellation of form if it was modified
     def ConfirmCancel(self):
         if self.modified:
             answer = askyesno(title='Cancel entry?', message='Changes to the record will be lost if you cancel. Are you sure you want to cancel?', icon=WARNING, parent=self)
             if answer:
-                self.destroy()
+                self.Close()
             else:
                 return
         else:
-            self.destroy()
+            self.Close()
 
 #################################################
 #| New Record Window Class                     |#
 #################################################
 
-# As with InspectRecordWindow, we don't need to instantiate a variable referencing an instance of this class
+# As with InspectRecordWindow, we don't need to keep a variable referencing an instance of this class
 # Only one of these windows at a time can be called, since we grab and keep focus from the main window
 
-class NewRecordWindow(tk.Toplevel):
+class NewRecordWindow(PooledWindow):
     def __init__(self, parent):
         super().__init__(parent)
         self.title('Enter New Vehicle Information')
-        self.focus_set()
-        self.grab_set()
         self.resizable(False, False)
         self.protocol('WM_DELETE_WINDOW', self.ConfirmCancel)
 
         self.parent = parent
-        
+
         self.createAddForm()
 
     def createAddForm(self):
@@ -806,89 +2095,58 @@ class NewRecordWindow(tk.Toplevel):
         header_text = 'VIN is required and cannot be changed after adding the record to the database.'
         ttk.Label(formHeaderFrame, text=header_text, wraplength=400, justify='left').pack(padx=5, pady=5, fill='x')
 
-        formFrame = ttk.LabelFrame(self, text='Fields')
-        formFrame.pack(padx=5, pady=(5,10), fill='x')
+        self.form = RecordForm(self, range(len(fields)), checkNumbers=True)
+        self.form.pack(padx=5, pady=(5,10), fill='x')
 
-        for i in range(len(fields)):
-            ttk.Label(formFrame, text=fields[i]['label']).grid(row=i, column=0, padx=5, pady=5, sticky=tk.W)
-        
-        self.string_vars = []
-        self.form_widgets = []
+        #Auto generate the v_num value, prevent user entry
+        self.form.DisableRow(0)
 
-        for i in range(len(fields)):
-            self.string_vars.append(tk.StringVar(self,''))
-            
-            if(fields[i]['search_by'] == 'dropdown'):
-                dropdown = fields[i]['dropdown_values']
-                self.form_widgets.append(ttk.Combobox(formFrame, width=fields[i]['dropdown_width'], textvariable=self.string_vars[i], values=dropdown, state='readonly'))
-                self.form_widgets[i].grid(row=i, column=1, padx=5, pady=5, sticky=tk.W)
-            elif(fields[i]['search_by'] == 'radio'):
-                self.form_widgets.append(ttk.Frame(formFrame))
-                self.form_widgets[i].grid(row=i, column=1, padx=5, pady=5, sticky=tk.W)
-                for radio_value in fields[i]['radio_values']:
-                    ttk.Radiobutton(self.form_widgets[i], text=radio_value, value=radio_value, variable=self.string_vars[i]).pack(padx=5, pady=5, side='left')
-            else:
-                #Auto generate the v_num value, prevent user entry
-                if(fields[i]['column'] == 'v_num'):
-                    self.form_widgets.append(ttk.Entry(formFrame, width=fields[i]['entry_width'], textvariable=self.string_vars[i], state=tk.DISABLED))
-                    self.string_vars[i].set(self.GetNewID())
-                    self.form_widgets[i].grid(row=i, column=1, padx=5, pady=5, sticky=tk.W)
-                else:
-                    self.form_widgets.append(ttk.Entry(formFrame, width=fields[i]['entry_width'], textvariable=self.string_vars[i]))
-                    self.form_widgets[i].grid(row=i, column=1, padx=5, pady=5, sticky=tk.W)
-            
-            self.string_vars[i].trace('w', lambda a, b, c, field_index=i : self.InputChecker(a, b, c, field_index))
-        
         buttonFrame = ttk.Frame(self)
         buttonFrame.pack(padx=5, pady=5, fill='x')
         ttk.Button(buttonFrame, text='Clear Fields', command=self.ClearFields).pack(side='left')
         ttk.Button(buttonFrame, text='Submit', command=self.BuildValues).pack(side='right')
         ttk.Button(buttonFrame, text='Cancel', command=self.ConfirmCancel).pack(side='right')
-    
+
+    # Reset the window with empty fields and a new v_num, called by Open()
+    def Bind(self):
+        values = [''] * len(fields)
+        values[0] = str(self.GetNewID())
+        self.form.SetValues(values)
+        self.focus_set()
+        self.grab_set()
+
     # Clears each field of any input by the user (except v_num)
     def ClearFields(self):
-        for i in range(1, len(self.string_vars)):
-            self.string_vars[i].set('')
+        self.form.ClearFields(1)
 
     # Obtain a unique ID for v_num
     def GetNewID(self):
-        records = self.parent.database.SelectAllRecords()
-        id_list = []
-
-        for record in records:
-            id_list.append(record[0])
-        
-        last_id = sorted(id_list)[-1]
+        return self.parent.database.GetLastID() + 1
 
-        return last_id+1
-    
-    # Check input for invalid values and prevent them
-    def InputChecker(self, a, b, c, field_index):
-        current_string = self.string_vars[field_index].get()
-
-        if fields[field_index]['type'] == 'number':
-            if not current_string.isnumeric():
-                if len(current_string) == 0:
-                    return
-                if len(current_string) == 1:
-                    self.string_vars[field_index].set('')
-                    showwarning(title='Warning', message='This field can only contain numbers', parent=self)
-                else:
-                    self.string_vars[field_index].set(current_string[0:-1])
-                    showwarning(title='Warning', message='This field can only contain numbers', parent=self)
-    
     # Build a list that will conform to the SQL query structure
     def BuildValues(self):
         self.parent.Log('Building new record values...')
-        value_list = []
-        
-        for i in range(len(self.string_vars)):
-            value_list.append(self.string_vars[i].get())
+        value_list = self.form.GetValues()
+
         if value_list[1] == '':
             showwarning(title='Warning', message='VIN is required.', parent=self)
             return
+        duplicate = self.parent.database.SelectRecordByVIN(value_list[1])
+        if duplicate is not None:
+            showwarning(title='Warning', message='This VIN is already in use by Vehicle # {}.'.format(duplicate[0]), parent=self)
+            return
+
+        #Fill in a blank year and make from the VIN and show them in the form, older and imported VINs may not decode so problems are only a warning
+        year_index = [field['column'] for field in fields].index('year')
+        make_index = [field['column'] for field in fields].index('make')
+        problems, value_list[year_index], value_list[make_index] = CheckVIN(value_list[1], value_list[year_index], value_list[make_index])
+        self.form.SetValues(value_list)
+        if problems:
+            answer = askyesno(title='Check the VIN', message='There may be a problem with this vehicle: ' + '; '.join(problems) + '. Do you want to add it anyway?', icon=WARNING, parent=self)
+            if not answer:
+                return
         self.AskAddCancel(value_list)
-    
+
     # Confirm user intent to add the record
     def AskAddCancel(self, values):
         answer = askokcancel(title='Add the record?', message='Click OK to add the vehicle to the database. The Vehicle # and VIN cannot be changed after the record is added.', icon=WARNING, parent=self)
@@ -897,19 +2155,19 @@ class NewRecordWindow(tk.Toplevel):
                 result = self.parent.database.AddRecord(values)
                 if result == None:
                     showinfo(title='Record added', message='The vehicle was added successfully.')
-                    
-                    self.parent.PopulateVehicleTable(self.parent.database.SelectAllRecords())
-                    self.destroy()
+
+                    self.Close()
+                    self.parent.RefreshChangedRows()
                 else:
                     raise DatabaseError
             except DatabaseError:
                 showerror(title='Error', message='There was a problem adding the record: ' + str(result) + '.')
-    
+
     # Confirm user intent to cancel form if any of the fields are not empty
     def ConfirmCancel(self):
         all_fields_empty = True
-        for i in range(1,len(self.string_vars)):
-            if (self.string_vars[i].get() == ''):
+        for value in self.form.GetValues()[1:]:
+            if (value == ''):
                 continue
             else:
                 all_fields_empty = False
@@ -917,9 +2175,106 @@ class NewRecordWindow(tk.Toplevel):
         if all_fields_empty == False:
             answer = askyesno(title='Cancel entry?', message='The field entries will be lost if you cancel. Are you sure you want to cancel?', icon=WARNING, parent=self)
             if answer:
-                self.destroy()
+                self.Close()
         else:
-            self.destroy()
+            self.Close()
+
+#################################################
+#| Batch Edit Window Class                     |#
+#################################################
+
+# BatchEditWindow applies the same field values to every vehicle selected in the main window
+# Like NewRecordWindow it grabs focus, so only one can be open at a time
+# v_num and VIN identify each vehicle, so they are left out of the form
+
+class BatchEditWindow(PooledWindow):
+    def __init__(self, parent):
+        super().__init__(parent)
+        self.title('Edit Selected Vehicles')
+        self.resizable(False, False)
+        self.protocol('WM_DELETE_WINDOW', self.ConfirmCancel)
+
+        self.parent = parent
+
+        self.createBatchForm()
+
+    def createBatchForm(self):
+        formHeaderFrame = ttk.Frame(self)
+        formHeaderFrame.pack(padx=5, pady=5, fill='x')
+        self.headerText = tk.StringVar(self)
+        ttk.Label(formHeaderFrame, textvariable=self.headerText, wraplength=400, justify='left').pack(padx=5, pady=5, fill='x')
+
+        #Index of each editable field in fields, the form rows follow this list
+        self.field_indexes = []
+        for i in range(len(fields)):
+            if fields[i]['column'] != 'v_num' and fields[i]['column'] != 'vin':
+                self.field_indexes.append(i)
+
+        self.form = RecordForm(self, self.field_indexes, checkNumbers=True)
+        self.form.pack(padx=5, pady=(5,10), fill='x')
+
+        buttonFrame = ttk.Frame(self)
+        buttonFrame.pack(padx=5, pady=5, fill='x')
+        ttk.Button(buttonFrame, text='Clear Fields', command=self.ClearFields).pack(side='left')
+        ttk.Button(buttonFrame, text='Submit', command=self.BuildValues).pack(side='right')
+        ttk.Button(buttonFrame, text='Cancel', command=self.ConfirmCancel).pack(side='right')
+
+    # Reset the window for the selected vehicles, called by Open()
+    def Bind(self, ids):
+        self.record_ids = list(ids)
+        self.headerText.set('Enter the values to set on the {} selected vehicles. Blank fields are left unchanged.'.format(len(self.record_ids)))
+        self.form.SetValues([''] * len(self.field_indexes))
+        self.focus_set()
+        self.grab_set()
+
+    # Clears each field of any input by the user
+    def ClearFields(self):
+        self.form.ClearFields()
+
+    # Build a list of (column, value) pairs for every non-empty field
+    def BuildValues(self):
+        self.parent.Log('Building batch changes...')
+        changes = []
+
+        form_values = self.form.GetValues()
+        for row in range(len(form_values)):
+            if form_values[row] != '':
+                changes.append((fields[self.field_indexes[row]]['column'], form_values[row]))
+
+        if len(changes) == 0:
+            showwarning(title='Warning', message='You must enter at least one field to change.', parent=self)
+            return
+        self.AskChangeCancel(changes)
+
+    # Confirm user intent, then update every selected record in one statement
+    def AskChangeCancel(self, changes):
+        message = 'Click OK to apply the changes to all {} selected vehicles.'.format(len(self.record_ids))
+        answer = askokcancel(title='Submit the changes?', message=message, icon=WARNING, parent=self)
+        if answer:
+            try:
+                result = self.parent.database.UpdateRecords(self.record_ids, changes)
+                if isinstance(result, Error):
+                    raise DatabaseError
+                else:
+                    showinfo(title='Records updated', message='{} vehicles were updated successfully.'.format(result), parent=self)
+                    self.Close()
+                    self.parent.RefreshChangedRows()
+            except DatabaseError:
+                showerror(title='Error', message='There was a problem modifying the records: ' + str(result) + '.', parent=self)
+
+    # Confirm user intent to cancel form if any of the fields are not empty
+    def ConfirmCancel(self):
+        all_fields_empty = True
+        for value in self.form.GetValues():
+            if (value != ''):
+                all_fields_empty = False
+                break
+        if all_fields_empty == False:
+            answer = askyesno(title='Cancel entry?', message='The field entries will be lost if you cancel. Are you sure you want to cancel?', icon=WARNING, parent=self)
+            if answer:
+                self.Close()
+        else:
+            self.Close()
 
 #################################################
 #| Main Program                                |#